@@ -0,0 +1,29 @@
+"""Compare the memory held by a level-1 dict of lists and an array-backed SeqCol"""
+
+import argparse
+import tracemalloc
+
+import seqcol
+
+from genomes import synthetic_collection
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ncontigs", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    csc, dict_bytes = measure(lambda: synthetic_collection(args.ncontigs))
+    obj, seqcol_bytes = measure(lambda: seqcol.SeqCol.from_dict(csc))
+    assert obj.to_dict() == csc
+    print(f"dict of lists: {dict_bytes / 2**20:8.1f} MiB")
+    print(f"SeqCol:        {seqcol_bytes / 2**20:8.1f} MiB")
+    print(f"saving:        {dict_bytes / seqcol_bytes:8.1f}x")
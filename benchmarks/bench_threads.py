@@ -0,0 +1,38 @@
+"""Compare serial and thread-pool FASTA digesting on a synthetic genome"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import seqcol
+
+from genomes import write_fasta
+
+
+def time_digest(path, threads):
+    start = time.perf_counter()
+    csc = seqcol.fasta_file_to_seqcol(path, threads=threads)
+    return time.perf_counter() - start, csc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nseqs", type=int, default=8)
+    parser.add_argument("--length", type=int, default=2_000_000)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "synthetic.fa")
+        write_fasta(path, args.nseqs, args.length)
+        seqcol.parse_fasta(path)  # build the index outside the timed runs
+        mb = args.nseqs * args.length / 1e6
+        serial_time, serial = time_digest(path, 1)
+        threaded_time, threaded = time_digest(path, args.threads)
+        assert serial == threaded
+        print(f"serial:            {serial_time:.2f}s ({mb / serial_time:.1f} MB/s)")
+        print(
+            f"threads={args.threads:<3}       {threaded_time:.2f}s ({mb / threaded_time:.1f} MB/s)"
+        )
+        print(f"speedup:           {serial_time / threaded_time:.2f}x")
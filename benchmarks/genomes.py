@@ -0,0 +1,81 @@
+"""Deterministic synthetic genomes, chrom.sizes files and collections for benchmarks"""
+
+import base64
+import hashlib
+import random
+
+# name: (number of sequences, sequence length) at scale 1
+PROFILES = {
+    "few_huge": (4, 8_000_000),
+    "chromosomes": (25, 1_000_000),
+    "scaffolds": (2_000, 10_000),
+    "tiny_contigs": (200_000, 100),
+}
+
+_TO_ACGT = bytes(b"ACGT"[i % 4] for i in range(256))
+
+
+def profile_shape(profile, scale=1.0):
+    """
+    Number and length of the sequences of a profile. Scaling multiplies the
+    number of sequences of the contig-heavy profiles and the lengths of the
+    others, so "few_huge" stays few and "tiny_contigs" stays tiny.
+    """
+    nseqs, length = PROFILES[profile]
+    if nseqs >= 1000:
+        return max(1, int(nseqs * scale)), length
+    return nseqs, max(1, int(length * scale))
+
+
+def random_sequence(rng, length):
+    """Random ACGT bytes; much faster than rng.choices for large sequences"""
+    return rng.randbytes(length).translate(_TO_ACGT)
+
+
+def write_fasta(path, nseqs, seq_length, seed=0, line_length=60):
+    """Write nseqs random sequences of seq_length bases; the same seed gives the same file"""
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        for i in range(nseqs):
+            f.write(b">chr%d\n" % (i + 1))
+            seq = random_sequence(rng, seq_length)
+            for j in range(0, seq_length, line_length):
+                f.write(seq[j : j + line_length] + b"\n")
+    return nseqs * seq_length
+
+
+def write_profile_fasta(path, profile, scale=1.0, seed=0):
+    """Write the FASTA file of a profile, returning its number of bases"""
+    return write_fasta(path, *profile_shape(profile, scale), seed=seed)
+
+
+def fake_digest(i, prefix=""):
+    """A sha512t24u-shaped digest, distinct for every i"""
+    return (
+        prefix + base64.urlsafe_b64encode(hashlib.sha512(str(i).encode()).digest()[:24]).decode()
+    )
+
+
+def write_chrom_sizes(path, nseqs, seq_length):
+    """Write a 4-column chrom.sizes file (name, length, digest, md5) without sequences"""
+    with open(path, "w") as f:
+        for i in range(nseqs):
+            f.write(
+                f"chr{i + 1}\t{seq_length}\t{fake_digest(i, 'SQ.')}\t"
+                f"{hashlib.md5(str(i).encode()).hexdigest()}\n"
+            )
+
+
+def synthetic_collection(ncontigs, offset=0):
+    """
+    Level-1 collection of ncontigs sequences. Collections built with
+    different offsets share ncontigs - offset sequences, so comparing them
+    exercises both the matching and the non-matching paths.
+    """
+    ids = range(offset, offset + ncontigs)
+    return {
+        "lengths": [1000 + i for i in ids],
+        "names": [f"contig_{i}" for i in ids],
+        "sequences": [fake_digest(i, "SQ.") for i in ids],
+        "sorted_name_length_pairs": sorted(fake_digest(-i) for i in ids),
+    }
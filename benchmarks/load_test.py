@@ -0,0 +1,92 @@
+"""Run the reference seqcol service locally and report its latency and throughput"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import os
+import statistics
+import threading
+import time
+
+import seqcol
+
+DEMO_FASTA = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "demo_fasta")
+
+
+def start_service(fasta_files):
+    scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+    digests = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for f in fasta_files:
+            digests.append(scc.load_fasta_from_filepath(f)["digest"])
+    server = seqcol.SeqColService(scc).make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, digests
+
+
+def client(port, paths, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for path in paths:
+        start = time.perf_counter()
+        conn.request("GET", path)
+        res = conn.getresponse()
+        res.read()
+        latencies.append(time.perf_counter() - start)
+        if res.status != 200:
+            errors.append((path, res.status))
+    conn.close()
+
+
+def run(port, paths, nclients):
+    latencies, errors = [], []
+    per_client = [paths[i::nclients] for i in range(nclients)]
+    threads = [
+        threading.Thread(target=client, args=(port, p, latencies, errors)) for p in per_client
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(name, latencies, errors, elapsed):
+    q = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<12} n={len(latencies):<6} p50={q[49] * 1000:7.2f}ms  "
+        f"p99={q[98] * 1000:7.2f}ms  {len(latencies) / elapsed:8.0f} req/s  errors={len(errors)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    fasta_files = [
+        os.path.join(DEMO_FASTA, f)
+        for f in sorted(os.listdir(DEMO_FASTA))
+        if ".fa" in f and not f.endswith(".fai")
+    ]
+    server, digests = start_service(fasta_files)
+    port = server.server_port
+    scenarios = {
+        "collection": [f"/collection/{digests[i % len(digests)]}" for i in range(args.requests)],
+        "level1": [
+            f"/collection/{digests[i % len(digests)]}?level=1" for i in range(args.requests)
+        ],
+        "comparison": [
+            f"/comparison/{digests[i % len(digests)]}/{digests[(i + 1) % len(digests)]}"
+            for i in range(args.requests)
+        ],
+    }
+    try:
+        for name, paths in scenarios.items():
+            report(name, *run(port, paths, args.clients))
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,314 @@
+"""Benchmark suite: digest throughput, compare latency, validation overhead and peak memory
+
+Run the suite and store the results as a baseline:
+
+    python benchmarks/suite.py --quick --save benchmarks/baselines/quick.json
+
+Run it again later and report the changes against the stored baseline; the
+exit code is 1 if any benchmark regressed by more than --threshold:
+
+    python benchmarks/suite.py --quick --compare benchmarks/baselines/quick.json
+
+Timings are the best of --repeat runs. Peak memory is the peak of Python
+allocations traced by tracemalloc, measured in separate runs. Results with
+a BUDGETS entry must stay within it, or the exit code is 1.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import genomes
+import seqcol
+
+# units in which a larger value is better; in all others smaller is better
+HIGHER_IS_BETTER = {"MB/s"}
+# maximum values, e.g. cold start seconds of short-lived jobs and the CLI
+BUDGETS = {"startup.import": 0.15, "startup.cli_digest": 0.5}
+DEMO_FASTA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "demo_fasta", "demo0.fa"
+)
+BENCHMARKS = []
+
+
+def benchmark(fn):
+    """Register a benchmark: a function of a Context returning {name: (value, unit)}"""
+    BENCHMARKS.append(fn)
+    return fn
+
+
+class Context:
+    """Settings and scratch directory shared by the benchmarks of a run"""
+
+    def __init__(self, workdir, scale, repeat):
+        self.workdir = workdir
+        self.scale = scale
+        self.repeat = repeat
+
+    def sizes(self, *sizes):
+        return [max(10, int(n * self.scale)) for n in sizes]
+
+    def best_time(self, fn, min_time=0.05):
+        """Best seconds per call of fn; fast calls are looped to reduce timer noise"""
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            loops *= 10
+        best = elapsed / loops
+        for _ in range(self.repeat - 1):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            best = min(best, (time.perf_counter() - start) / loops)
+        return best
+
+    @staticmethod
+    def peak_memory(fn):
+        """Peak MiB allocated while running fn"""
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+
+
+def quiet(fn, *args, **kwargs):
+    """Call fn with its per-sequence progress output silenced"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args, **kwargs)
+
+
+@benchmark
+def digest_fasta(ctx):
+    results = {}
+    for profile in genomes.PROFILES:
+        path = os.path.join(ctx.workdir, f"{profile}.fa")
+        nbases = genomes.write_profile_fasta(path, profile, ctx.scale)
+        seqcol.parse_fasta(path)  # build the index outside the timed runs
+        seconds = ctx.best_time(lambda: quiet(seqcol.fasta_file_to_seqcol, path))
+        results[f"digest.{profile}"] = (nbases / 1e6 / seconds, "MB/s")
+        results[f"peakmem.digest.{profile}"] = (
+            ctx.peak_memory(lambda: quiet(seqcol.fasta_file_to_seqcol, path)),
+            "MiB",
+        )
+    return results
+
+
+@benchmark
+def chrom_sizes(ctx):
+    results = {}
+    for n in ctx.sizes(10_000, 200_000):
+        path = os.path.join(ctx.workdir, f"{n}.chrom.sizes")
+        genomes.write_chrom_sizes(path, n, 100)
+        results[f"chrom_sizes.{n}"] = (
+            ctx.best_time(lambda: seqcol.chrom_sizes_to_seqcol(path)),
+            "s",
+        )
+    return results
+
+
+@benchmark
+def seqcol_digest(ctx):
+    results = {}
+    for n in ctx.sizes(1_000, 100_000):
+        csc = genomes.synthetic_collection(n)
+        results[f"seqcol_digest.{n}"] = (ctx.best_time(lambda: seqcol.seqcol_digest(csc)), "s")
+    return results
+
+
+@benchmark
+def compare(ctx):
+    results = {}
+    for n in ctx.sizes(100, 2_000, 20_000):
+        A = genomes.synthetic_collection(n)
+        B = genomes.synthetic_collection(n, offset=n // 10)
+        results[f"compare.{n}"] = (ctx.best_time(lambda: seqcol.compare_seqcols(A, B)), "s")
+        results[f"peakmem.compare.{n}"] = (
+            ctx.peak_memory(lambda: seqcol.compare_seqcols(A, B)),
+            "MiB",
+        )
+    return results
+
+
+@benchmark
+def batch_compare(ctx):
+    """Flags of every pair of n collections of 25 sequences, overlapping in sequence"""
+    results = {}
+    for n in ctx.sizes(100, 1_000):
+        collections = [genomes.synthetic_collection(25, offset=i) for i in range(n)]
+        results[f"batch_compare.{n}x{n}"] = (
+            ctx.best_time(lambda: seqcol.batch_compare_flags(collections, collections)),
+            "s",
+        )
+    return results
+
+
+@benchmark
+def validate(ctx):
+    results = {}
+    for n in ctx.sizes(100, 10_000, 100_000):
+        csc = genomes.synthetic_collection(n)
+        results[f"validate.{n}"] = (ctx.best_time(lambda: seqcol.validate_seqcol(csc)), "s")
+    return results
+
+
+@benchmark
+def henge_insert_retrieve(ctx):
+    results = {}
+    for n in ctx.sizes(1_000, 20_000):
+        csc = genomes.synthetic_collection(n)
+
+        def insert():
+            scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+            return scc, scc.insert(csc, seqcol.SCAS_NAME, reclimit=1)
+
+        results[f"henge.insert.{n}"] = (ctx.best_time(insert), "s")
+        scc, digest = insert()
+        results[f"henge.retrieve.{n}"] = (
+            ctx.best_time(lambda: scc.retrieve(digest, reclimit=1)),
+            "s",
+        )
+    return results
+
+
+@benchmark
+def startup(ctx):
+    """Cold start of a fresh interpreter importing seqcol, and of the CLI"""
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(seqcol.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    commands = {
+        "startup.python": [sys.executable, "-c", "pass"],
+        "startup.import": [sys.executable, "-c", "import seqcol"],
+        "startup.cli_digest": [sys.executable, "-m", "seqcol", "digest", DEMO_FASTA],
+    }
+    results = {}
+    for name, command in commands.items():
+        run = lambda: subprocess.run(command, env=env, check=True, capture_output=True)
+        results[name] = (ctx.best_time(run, min_time=0), "s")
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "seqcol": seqcol.__version__,
+    }
+
+
+def run_suite(scale, repeat, selected=None):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        ctx = Context(workdir, scale, repeat)
+        for fn in BENCHMARKS:
+            if selected and not any(s in fn.__name__ for s in selected):
+                continue
+            start = time.perf_counter()
+            for name, (value, unit) in fn(ctx).items():
+                results[name] = {"value": value, "unit": unit}
+            print(f"{fn.__name__:<24} {time.perf_counter() - start:6.1f}s", file=sys.stderr)
+    return results
+
+
+def change(baseline, current, unit):
+    """How many times worse current is than baseline; below 1 is an improvement"""
+    if unit in HIGHER_IS_BETTER:
+        baseline, current = current, baseline
+    if baseline == 0:
+        return 1.0 if current == 0 else float("inf")
+    return current / baseline
+
+
+def check_budgets(results):
+    """Print the results over their budget and return their names"""
+    over = []
+    for name, limit in BUDGETS.items():
+        if name in results and results[name]["value"] > limit:
+            print(f"{name} is over budget: {results[name]['value']:.4g} > {limit:.4g}")
+            over.append(name)
+    return over
+
+
+def compare_report(baseline, current, threshold):
+    """Print a table of changes against the baseline; return the regressed benchmark names"""
+    if baseline.get("scale") != current.get("scale"):
+        print(f"warning: baseline scale {baseline.get('scale')} != {current.get('scale')}")
+    regressions = []
+    print(f"{'benchmark':<34} {'baseline':>12} {'current':>12} {'unit':<5} {'change':>8}")
+    for name, result in current["results"].items():
+        unit = result["unit"]
+        if name not in baseline["results"]:
+            print(f"{name:<34} {'-':>12} {result['value']:12.4g} {unit:<5}      new")
+            continue
+        before = baseline["results"][name]["value"]
+        factor = change(before, result["value"], unit)
+        flag = ""
+        if factor > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif factor < 1 / threshold:
+            flag = "  improved"
+        value = result["value"]
+        print(f"{name:<34} {before:12.4g} {value:12.4g} {unit:<5} {factor:7.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the synthetic inputs")
+    parser.add_argument("--quick", action="store_true", help="shorthand for --scale 0.05")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--select", nargs="*", help="run only benchmarks matching these names")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to report changes against")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="factor by which a benchmark may worsen"
+    )
+    args = parser.parse_args()
+    scale = 0.05 if args.quick else args.scale
+
+    current = {
+        "scale": scale,
+        "environment": environment(),
+        "results": run_suite(scale, args.repeat, args.select),
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        failed = compare_report(baseline, current, args.threshold)
+    else:
+        failed = []
+        for name, result in current["results"].items():
+            print(f"{name:<34} {result['value']:12.4g} {result['unit']}")
+    failed += check_budgets(current["results"])
+    sys.exit(1 if failed else 0)
@@ -1,8 +1,42 @@
+import importlib
+
 from .const import *
-from .seqcol import *
+from .collection import SeqCol
+from .metrics import METRICS, Metrics, print_progress, rate_limited
 from .utilities import *
 from ._version import __version__
 
+# Attributes whose modules import henge, asyncio, numpy or http.server are
+# loaded on first access, so that importing seqcol for a digest stays fast
+_LAZY_ATTRIBUTES = {
+    "SeqColHenge": "seqcol",
+    "SeqColConf": "seqcol",
+    "LazyMapping": "seqcol",
+    "LazyList": "seqcol",
+    "AsyncSeqColHenge": "async_henge",
+    "BloomFilter": "bloom",
+    "batch_compare_flags": "flags",
+    "compare_flags": "flags",
+    "SeqColCatalog": "catalog",
+    "write_catalog": "catalog",
+    "SeqColService": "service",
+    "ShardedDatabase": "sharding",
+    "SQLiteStore": "sharding",
+    "SeqColValidator": "utilities",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
 
 __classes__ = ["SeqColHenge"]
 __all__ = (
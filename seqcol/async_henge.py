@@ -0,0 +1,109 @@
+import asyncio
+import functools
+import logging
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
+from .metrics import METRICS
+from .seqcol import SeqColHenge
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncSeqColHenge:
+    """
+    Awaitable interface to a SeqColHenge, for use in async web services.
+
+    henge retrieval and insertion are synchronous, so each call is run on an
+    executor to keep the event loop free. At most max_concurrency calls run
+    at once, and simultaneous retrieve or compare requests for the same
+    digests share a single lookup.
+    """
+
+    def __init__(
+        self,
+        henge_obj: SeqColHenge,
+        executor: Optional[Executor] = None,
+        max_concurrency: int = 8,
+    ):
+        """
+        :param SeqColHenge henge_obj: the henge to wrap
+        :param Executor executor: executor running the blocking calls; a
+            thread pool of max_concurrency threads by default
+        :param int max_concurrency: maximum number of calls running at once
+        """
+        self.henge = henge_obj
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="seqcol"
+        )
+        self._semaphore = None
+        self._inflight = {}
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking henge call on the executor, bounded by the concurrency limit"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs)
+            )
+
+    async def _coalesced(self, key, fn, *args, **kwargs):
+        """
+        Run a call, or join an identical one already in flight. Callers that
+        share a call receive the same result object and must not mutate it.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(fn, *args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            _LOGGER.debug(f"Joining in-flight request: {key}")
+            METRICS.increment("coalesced_requests")
+        # shield, so one cancelled caller does not cancel the shared lookup
+        return await asyncio.shield(task)
+
+    async def retrieve(self, druid, reclimit=None, raw=False):
+        """Awaitable SeqColHenge.retrieve"""
+        return await self._coalesced(
+            ("retrieve", druid, reclimit, raw), self.henge.retrieve, druid, reclimit, raw
+        )
+
+    async def insert(self, item, item_type, reclimit=None):
+        """Awaitable SeqColHenge.insert"""
+        return await self._call(self.henge.insert, item, item_type, reclimit)
+
+    async def compare_digests(self, digestA, digestB):
+        """Awaitable SeqColHenge.compare_digests"""
+        return await self._coalesced(
+            ("compare", digestA, digestB), self.henge.compare_digests, digestA, digestB
+        )
+
+    async def load_fasta_from_filepath(self, filepath, threads=1, fai_cache_dir=None):
+        """Awaitable SeqColHenge.load_fasta_from_filepath"""
+        return await self._call(
+            self.henge.load_fasta_from_filepath,
+            filepath,
+            threads=threads,
+            fai_cache_dir=fai_cache_dir,
+        )
+
+    async def load_from_chromsizes(self, chromsizes):
+        """Awaitable SeqColHenge.load_from_chromsizes"""
+        return await self._call(self.henge.load_from_chromsizes, chromsizes)
+
+    def close(self):
+        """Shut down the executor, if it was created by this object"""
+        if self._own_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
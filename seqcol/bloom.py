@@ -0,0 +1,156 @@
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+
+from typing import Iterable
+
+BLOOM_MAGIC = b"SEQCOLBF"
+# each new stage of a scalable filter holds twice as many items at half the
+# false-positive rate, so the rates sum to at most error_rate overall
+_GROWTH = 2
+_TIGHTENING = 0.5
+
+
+class _Stage:
+    """Fixed-size Bloom filter, one stage of a BloomFilter"""
+
+    __slots__ = ("capacity", "nbits", "nhashes", "count", "bits")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.nbits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.nbits + 7) // 8)
+
+    def positions(self, h1: int, h2: int):
+        nbits = self.nbits
+        return [(h1 + i * h2) % nbits for i in range(self.nhashes)]
+
+    def add(self, h1: int, h2: int):
+        bits = self.bits
+        for p in self.positions(h1, h2):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, hashes) -> bool:
+        h1, h2 = hashes
+        bits, nbits = self.bits, self.nbits
+        for i in range(self.nhashes):
+            p = (h1 + i * h2) % nbits
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+def _hashes(key: str) -> tuple:
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    h1, h2 = struct.unpack("<QQ", digest)
+    return h1, h2 | 1
+
+
+class BloomFilter:
+    """
+    Scalable Bloom filter of strings, e.g. the digests stored in a henge.
+
+    A lookup may report a string that was never added (a false positive, at
+    most error_rate of the time) but never misses one that was. Once the
+    current stage holds its capacity, a larger and stricter stage is added,
+    so the filter sizes itself to the number of items without exceeding the
+    error rate.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        """
+        :param int capacity: number of items the first stage holds
+        :param float error_rate: maximum false-positive rate
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1: {error_rate}")
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.stages = []
+        self._lock = threading.Lock()
+        self._add_stage()
+
+    def _add_stage(self):
+        n = len(self.stages)
+        self.stages.append(
+            _Stage(
+                self.capacity * _GROWTH**n,
+                self.error_rate * (1 - _TIGHTENING) * _TIGHTENING**n,
+            )
+        )
+
+    def add(self, key: str):
+        hashes = _hashes(key)
+        # concurrent unlocked updates of a shared byte could lose a bit
+        with self._lock:
+            if any(hashes in stage for stage in self.stages):
+                return
+            if self.stages[-1].count >= self.stages[-1].capacity:
+                self._add_stage()
+            self.stages[-1].add(*hashes)
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        hashes = _hashes(key)
+        return any(hashes in stage for stage in self.stages)
+
+    def __len__(self) -> int:
+        """Approximate number of distinct items added"""
+        return sum(stage.count for stage in self.stages)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(stage.bits) for stage in self.stages)
+
+    def save(self, path: str, **metadata):
+        """
+        Write the filter to a file, replacing it atomically
+
+        :param str path: file to write
+        :param metadata: JSON-serializable values stored with the filter and
+            returned by load
+        """
+        header = {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "counts": [stage.count for stage in self.stages],
+            "metadata": metadata,
+        }
+        header_bytes = json.dumps(header, sort_keys=True).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BLOOM_MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            for stage in self.stages:
+                f.write(stage.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple:
+        """
+        Read a filter written by save
+
+        :param str path: file to read
+        :return (BloomFilter, dict): the filter and the metadata saved with it
+        """
+        with open(path, "rb") as f:
+            if f.read(len(BLOOM_MAGIC)) != BLOOM_MAGIC:
+                raise ValueError(f"Not a seqcol Bloom filter: {path}")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+            bloom = cls(header["capacity"], header["error_rate"])
+            bloom.stages = []
+            for count in header["counts"]:
+                bloom._add_stage()
+                stage = bloom.stages[-1]
+                stage.bits = bytearray(f.read(len(stage.bits)))
+                stage.count = count
+        return bloom, header["metadata"]
@@ -0,0 +1,317 @@
+import bisect
+import json
+import logging
+import mmap
+import struct
+
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from .collection import IntColumn, SeqCol, StringColumn
+
+_LOGGER = logging.getLogger(__name__)
+
+CATALOG_MAGIC = b"SEQCOLC1"
+CATALOG_VERSION = 1
+_ALIGNMENT = 8
+
+
+class _SectionWriter:
+    """Append 8-byte aligned binary sections to a file, tracking their offsets"""
+
+    def __init__(self, f, start: int):
+        self.f = f
+        self.position = start
+
+    def write(self, data) -> int:
+        offset = self.position
+        data = bytes(data)
+        padding = -len(data) % _ALIGNMENT
+        self.f.write(data + b"\0" * padding)
+        self.position += len(data) + padding
+        return offset
+
+
+def _column_kind(values: list) -> str:
+    if all(type(v) is int for v in values):
+        return "int"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    raise ValueError("Catalog attributes must be arrays of only integers or only strings")
+
+
+def write_catalog(collections: Mapping, path: str) -> int:
+    """
+    Write level-1 collections to a columnar catalog file.
+
+    Each attribute is stored once for all collections: its values laid end to
+    end, plus an offset table giving each collection's slice. Collections are
+    sorted by digest, so SeqColCatalog finds one by binary search. Every
+    array is an 8-byte aligned int64 or UTF-8 section that SeqColCatalog maps
+    into memory without parsing.
+
+    :param Mapping collections: level-1 collections (dicts or SeqCol objects),
+        keyed by digest
+    :param str path: file to write
+    :return int: number of collections written
+    """
+    digests = sorted(collections)
+    widths = {len(d.encode()) for d in digests}
+    if len(widths) > 1:
+        raise ValueError("All collection digests in a catalog must have the same length")
+    header = {
+        "version": CATALOG_VERSION,
+        "count": len(digests),
+        "digest_width": widths.pop() if widths else 0,
+        "attributes": {},
+    }
+    attribute_names = sorted({k for d in digests for k in collections[d]})
+
+    with open(path, "wb") as f:
+        # the header goes last, once every section offset is known; its
+        # position and length are filled in here at the end
+        f.write(CATALOG_MAGIC + bytes(16))
+        writer = _SectionWriter(f, len(CATALOG_MAGIC) + 16)
+        header["digests"] = writer.write("".join(digests).encode())
+        for name in attribute_names:
+            present = bytearray(len(digests))
+            index = array("q", [0])
+            values = []
+            for i, d in enumerate(digests):
+                if name in collections[d]:
+                    present[i] = 1
+                    values.extend(collections[d][name])
+                index.append(len(values))
+            kind = _column_kind(values)
+            meta = {"type": kind, "nvalues": len(values)}
+            meta["present"] = writer.write(present)
+            meta["index"] = writer.write(index.tobytes())
+            if kind == "int":
+                meta["values"] = writer.write(array("q", values).tobytes())
+            else:
+                encoded = [v.encode() for v in values]
+                value_widths = {len(v) for v in encoded}
+                if len(value_widths) > 1:
+                    offsets = array("q", [0])
+                    for v in encoded:
+                        offsets.append(offsets[-1] + len(v))
+                    meta["offsets"] = writer.write(offsets.tobytes())
+                else:
+                    meta["width"] = value_widths.pop() if value_widths else 0
+                meta["values"] = writer.write(b"".join(encoded))
+            header["attributes"][name] = meta
+        header_bytes = json.dumps(header, sort_keys=True).encode()
+        header_offset = writer.write(header_bytes)
+        f.seek(len(CATALOG_MAGIC))
+        f.write(struct.pack("<QQ", header_offset, len(header_bytes)))
+    _LOGGER.info(f"Wrote {len(digests)} collections to catalog: {path}")
+    return len(digests)
+
+
+class SeqColCatalog(Mapping):
+    """
+    Read-only, memory-mapped columnar catalog of level-1 collections.
+
+    Opening a catalog reads only its small header; the arrays are served
+    straight from the mapped file, so the OS page cache shares them among
+    all processes that open the same file. Maps digest to SeqCol.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param str path: catalog file written by write_catalog
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(CATALOG_MAGIC)] != CATALOG_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Not a seqcol catalog: {path}")
+        header_offset, header_length = struct.unpack(
+            "<QQ", self._mmap[len(CATALOG_MAGIC) : len(CATALOG_MAGIC) + 16]
+        )
+        self._header = json.loads(self._mmap[header_offset : header_offset + header_length])
+        if self._header["version"] != CATALOG_VERSION:
+            raise ValueError(f"Unsupported catalog version: {self._header['version']}")
+        self._view = memoryview(self._mmap)
+        self._count = self._header["count"]
+        width = self._header["digest_width"]
+        offset = self._header["digests"]
+        self._digests = StringColumn.from_buffer(
+            self._view[offset : offset + width * self._count], self._count, width=width
+        )
+        self._columns = {
+            name: self._map_attribute(meta) for name, meta in self._header["attributes"].items()
+        }
+
+    def _int64(self, offset: int, count: int) -> memoryview:
+        return self._view[offset : offset + 8 * count].cast("q")
+
+    def _map_attribute(self, meta: dict) -> dict:
+        n = meta["nvalues"]
+        column = {
+            "type": meta["type"],
+            "present": self._view[meta["present"] : meta["present"] + self._count],
+            "index": self._int64(meta["index"], self._count + 1),
+            "width": meta.get("width"),
+            "start": meta["values"],
+        }
+        if meta["type"] == "int":
+            column["values"] = self._int64(meta["values"], n)
+        elif column["width"] is not None:
+            column["values"] = self._view[meta["values"] : meta["values"] + column["width"] * n]
+        else:
+            column["offsets"] = self._int64(meta["offsets"], n + 1)
+            column["values"] = self._view[meta["values"] : meta["values"] + column["offsets"][n]]
+        return column
+
+    def _position(self, digest: str) -> Optional[int]:
+        i = bisect.bisect_left(self._digests, digest)
+        if i < self._count and self._digests[i] == digest:
+            return i
+        return None
+
+    def _array(self, column: dict, start: int, end: int):
+        if column["type"] == "int":
+            return IntColumn(column["values"][start:end])
+        if column["width"] is not None:
+            w = column["width"]
+            return StringColumn.from_buffer(
+                column["values"][start * w : end * w], end - start, width=w
+            )
+        return StringColumn.from_buffer(
+            column["values"], end - start, offsets=column["offsets"][start : end + 1]
+        )
+
+    def __getitem__(self, digest: str) -> SeqCol:
+        i = self._position(digest)
+        if i is None:
+            raise KeyError(digest)
+        attributes = {}
+        for name, column in self._columns.items():
+            if column["present"][i]:
+                attributes[name] = self._array(column, column["index"][i], column["index"][i + 1])
+        return SeqCol(attributes)
+
+    def __contains__(self, digest) -> bool:
+        return isinstance(digest, str) and self._position(digest) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._digests)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        """Unmap the catalog; collections retrieved from it must no longer be in use"""
+        self._digests = None
+        self._columns = {}
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def find(self, attribute: str, value) -> list:
+        """
+        Reverse lookup: digests of the collections whose attribute array contains value.
+
+        E.g. find("sequences", "SQ.xyz") lists every collection containing
+        that sequence. String columns are searched in the mapped bytes
+        directly, without decoding any element.
+
+        :param str attribute: attribute name, e.g. "sequences" or "names"
+        :param value: element to look for
+        :return list: matching collection digests
+        """
+        column = self._columns.get(attribute)
+        if column is None:
+            return []
+        if column["type"] == "int":
+            positions = [j for j, v in enumerate(column["values"]) if v == value]
+        else:
+            positions = self._find_string(column, value)
+        index = column["index"]
+        hits = []
+        for j in positions:
+            i = bisect.bisect_right(index, j) - 1
+            if not hits or hits[-1] != i:
+                hits.append(i)
+        return [self._digests[i] for i in hits]
+
+    def _find_string(self, column: dict, value: str) -> list:
+        """Positions of value in a string column, found by searching the mapped file"""
+        encoded = value.encode()
+        if not encoded:
+            return []
+        width, offsets = column["width"], column.get("offsets")
+        section_start = column["start"]
+        section_end = section_start + len(column["values"])
+        positions = []
+        found = self._mmap.find(encoded, section_start, section_end)
+        while found != -1:
+            relative = found - section_start
+            if width is not None:
+                if len(encoded) == width and relative % width == 0:
+                    positions.append(relative // width)
+            else:
+                j = bisect.bisect_left(offsets, relative)
+                if j < len(offsets) - 1 and offsets[j] == relative:
+                    if offsets[j + 1] - relative == len(encoded):
+                        positions.append(j)
+            found = self._mmap.find(encoded, found + 1, section_end)
+        return positions
+
+    def compare(self, seqcol_obj: Mapping, digests: list = None, processes: int = 1) -> dict:
+        """
+        Compare one collection against many collections in the catalog.
+
+        With processes > 1 the comparisons are split among worker processes,
+        each of which maps the same catalog file, so the collections are
+        shared through the page cache rather than copied to the workers.
+
+        :param Mapping seqcol_obj: level-1 collection to compare
+        :param list digests: catalog collections to compare against; all by default
+        :param int processes: number of worker processes
+        :return dict: compare_seqcols result keyed by collection digest
+        """
+        digests = list(self) if digests is None else list(digests)
+        if isinstance(seqcol_obj, SeqCol):
+            seqcol_obj = seqcol_obj.to_dict()
+        if processes <= 1:
+            return {d: r for d, r in _compare_chunk(self, seqcol_obj, digests)}
+        chunk_size = -(-len(digests) // processes)
+        chunks = [digests[i : i + chunk_size] for i in range(0, len(digests), chunk_size)]
+        results = {}
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(self.path,)
+        ) as executor:
+            for chunk_result in executor.map(
+                _compare_in_worker, [seqcol_obj] * len(chunks), chunks
+            ):
+                results.update(chunk_result)
+        return results
+
+
+def _compare_chunk(catalog: SeqColCatalog, seqcol_obj: Mapping, digests: list):
+    from .utilities import compare_seqcols
+
+    for d in digests:
+        yield d, compare_seqcols(seqcol_obj, catalog[d])
+
+
+_WORKER_CATALOG = None
+
+
+def _init_worker(path: str):
+    global _WORKER_CATALOG
+    _WORKER_CATALOG = SeqColCatalog(path)
+
+
+def _compare_in_worker(seqcol_obj: Mapping, digests: list) -> list:
+    return list(_compare_chunk(_WORKER_CATALOG, seqcol_obj, digests))
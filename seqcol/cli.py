@@ -0,0 +1,164 @@
+"""
+Command line interface: seqcol digest | compare | validate | verify
+
+Only the standard library and seqcol's light modules are imported at
+startup; pyfaidx and jsonschema are imported by the commands that need them.
+"""
+
+import argparse
+import json
+import sys
+
+from typing import Optional
+
+from ._version import __version__
+from .exceptions import InvalidSeqColError
+from .utilities import (
+    chrom_sizes_to_seqcol,
+    compare_seqcols,
+    fasta_file_to_seqcol,
+    iter_canonical_str,
+    load_seqcol_json,
+    sam_header_to_seqcol,
+    seqcol_digest,
+    validate_seqcol,
+    vcf_header_to_seqcol,
+    verify_fasta,
+    write_json_chunks,
+)
+
+FASTA_SUFFIXES = (".fa", ".fasta", ".fna", ".fa.gz", ".fasta.gz", ".fna.gz")
+SAM_SUFFIXES = (".sam", ".bam", ".cram")
+VCF_SUFFIXES = (".vcf", ".vcf.gz")
+CHROM_SIZES_SUFFIXES = (".chrom.sizes", ".sizes", ".tsv")
+
+
+def load_collection(path: str, threads: int = 1, fai_cache_dir: Optional[str] = None):
+    """
+    Read a level-2 collection from a FASTA, SAM/BAM/CRAM, VCF, chrom.sizes
+    or JSON file, chosen by its extension; "-" reads JSON from stdin. The
+    .fai of an unindexed FASTA goes to fai_cache_dir if given.
+    """
+    if path == "-":
+        return load_seqcol_json(sys.stdin.buffer)
+    lower = path.lower()
+    if lower.endswith(".json"):
+        with open(path, "rb") as f:
+            return load_seqcol_json(f)
+    if lower.endswith(FASTA_SUFFIXES):
+        return fasta_file_to_seqcol(
+            path, threads=threads, verbose=False, fai_cache_dir=fai_cache_dir
+        )
+    if lower.endswith(SAM_SUFFIXES):
+        return sam_header_to_seqcol(path)
+    if lower.endswith(VCF_SUFFIXES):
+        return vcf_header_to_seqcol(path)
+    if lower.endswith(CHROM_SIZES_SUFFIXES):
+        return chrom_sizes_to_seqcol(path)
+    raise ValueError(f"Unrecognized file type: {path}")
+
+
+def _write_json(item):
+    write_json_chunks(iter_canonical_str(item), sys.stdout)
+    sys.stdout.write("\n")
+
+
+def digest(args) -> int:
+    for path in args.files:
+        collection = load_collection(path, args.threads, args.fai_cache_dir)
+        if args.collection:
+            _write_json(collection)
+        elif len(args.files) > 1:
+            print(f"{seqcol_digest(collection)}\t{path}")
+        else:
+            print(seqcol_digest(collection))
+    return 0
+
+
+def compare(args) -> int:
+    _write_json(compare_seqcols(load_collection(args.a), load_collection(args.b)))
+    return 0
+
+
+def validate(args) -> int:
+    status = 0
+    for path in args.files:
+        try:
+            validate_seqcol(load_collection(path))
+        except InvalidSeqColError as e:
+            for error in e.errors:
+                print(f"{path}: {error.message}", file=sys.stderr)
+            status = 1
+        else:
+            print(f"{path}: valid")
+    return status
+
+
+def verify(args) -> int:
+    expected = load_collection(args.expected)
+    if args.digest and seqcol_digest(expected) != args.digest:
+        raise ValueError(f"{args.expected} is not the collection {args.digest}")
+    report = verify_fasta(
+        args.fasta,
+        expected,
+        threads=args.threads,
+        stop_early=not args.all,
+        fai_cache_dir=args.fai_cache_dir,
+    )
+    _write_json(report)
+    return 0 if report["match"] else 1
+
+
+def build_argparser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="seqcol", description="Compute, compare and validate sequence collections"
+    )
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sub = subparsers.add_parser("digest", help="Print the seqcol digest of each file")
+    sub.add_argument("files", nargs="+", help="FASTA, SAM/BAM/CRAM, VCF, chrom.sizes or JSON")
+    sub.add_argument(
+        "--collection", action="store_true", help="print the level-2 collection instead"
+    )
+    sub.add_argument("-p", "--threads", type=int, default=1, help="threads hashing sequences")
+    sub.add_argument(
+        "--fai-cache-dir", help="write the .fai of unindexed FASTA files here, not next to them"
+    )
+    sub.set_defaults(func=digest)
+
+    sub = subparsers.add_parser("compare", help="Compare two collections")
+    sub.add_argument("a", help="collection A, as any file digest accepts")
+    sub.add_argument("b", help="collection B, as any file digest accepts")
+    sub.set_defaults(func=compare)
+
+    sub = subparsers.add_parser("validate", help="Validate collections against the schema")
+    sub.add_argument("files", nargs="+", help="JSON collections, or files digest accepts")
+    sub.set_defaults(func=validate)
+
+    sub = subparsers.add_parser(
+        "verify", help="Check that a FASTA holds a collection; exit status 1 if not"
+    )
+    sub.add_argument("fasta", help="FASTA file to check")
+    sub.add_argument("expected", help="expected collection, as any file digest accepts")
+    sub.add_argument("--digest", help="check that the expected collection has this digest")
+    sub.add_argument("-p", "--threads", type=int, default=1, help="threads hashing sequences")
+    sub.add_argument(
+        "--all", action="store_true", help="report every difference, not just the first"
+    )
+    sub.add_argument("--fai-cache-dir", help="look for the .fai of the FASTA here too")
+    sub.set_defaults(func=verify)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_argparser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"seqcol: error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
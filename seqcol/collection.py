@@ -0,0 +1,263 @@
+from array import array
+from collections.abc import Mapping, Sequence
+from json.encoder import encode_basestring
+from typing import Iterator, Optional
+
+
+class IntColumn(Sequence):
+    """
+    Array of integers, such as sequence lengths, stored in a contiguous
+    int64 buffer instead of a list of boxed ints. The buffer may also be an
+    int64 memoryview, e.g. into a memory-mapped catalog.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, values=()):
+        if isinstance(values, (array, memoryview)):
+            self._data = values
+        else:
+            self._data = array("q", values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._data[i].tolist()
+        return self._data[i]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __contains__(self, value):
+        return value in self._data
+
+    def __eq__(self, other):
+        if isinstance(other, IntColumn):
+            return self._data == other._data
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"IntColumn({self.tolist()})"
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) * self._data.itemsize
+
+    def tolist(self) -> list:
+        return self._data.tolist()
+
+    def iter_json(self, chunk_size: int = 65536) -> Iterator[str]:
+        """Yield the canonical JSON array in chunks, straight from the buffer"""
+        yield "["
+        for start in range(0, len(self._data), chunk_size):
+            if start:
+                yield ","
+            yield ",".join(map(str, self._data[start : start + chunk_size]))
+        yield "]"
+
+
+class StringColumn(Sequence):
+    """
+    Array of strings, such as names or digests, stored as one UTF-8 buffer.
+
+    When every string encodes to the same number of bytes, as digests do,
+    element i is found at i * width and no offsets are stored. Otherwise an
+    int64 offset table locates each element.
+    """
+
+    __slots__ = ("_buffer", "_offsets", "_width", "_length")
+
+    def __init__(self, values=()):
+        encoded = [v.encode() for v in values]
+        widths = {len(v) for v in encoded}
+        self._buffer = b"".join(encoded)
+        self._length = len(encoded)
+        if len(widths) <= 1:
+            self._width = widths.pop() if widths else 0
+            self._offsets = None
+        else:
+            self._width = None
+            self._offsets = array("q", [0])
+            position = 0
+            for v in encoded:
+                position += len(v)
+                self._offsets.append(position)
+
+    @classmethod
+    def from_buffer(cls, buffer, length: int, width: int = None, offsets=None) -> "StringColumn":
+        """
+        Wrap an existing buffer without copying it.
+
+        :param buffer: bytes-like object holding the UTF-8 strings
+        :param int length: number of strings
+        :param int width: byte width of every string, for fixed-width columns
+        :param offsets: int64 sequence of length + 1 positions of the strings
+            in buffer, for variable-width columns
+        """
+        column = cls.__new__(cls)
+        column._buffer = buffer
+        column._length = length
+        column._width = width
+        column._offsets = offsets
+        return column
+
+    def _bounds(self, i: int) -> tuple:
+        if self._width is not None:
+            return i * self._width, (i + 1) * self._width
+        return self._offsets[i], self._offsets[i + 1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("StringColumn index out of range")
+        start, end = self._bounds(i)
+        return str(self._buffer[start:end], "utf-8")
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, value):
+        if not isinstance(value, str):
+            return False
+        if self._width is None or not hasattr(self._buffer, "find"):
+            return any(v == value for v in self)
+        encoded = value.encode()
+        if len(encoded) != self._width:
+            return False
+        if self._width == 0:
+            return self._length > 0
+        position = self._buffer.find(encoded)
+        while position != -1:
+            if position % self._width == 0:
+                return True
+            position = self._buffer.find(encoded, position + 1)
+        return False
+
+    def __eq__(self, other):
+        if isinstance(other, StringColumn) and self._width is not None:
+            if self._width == other._width and self._length == other._length:
+                return self._buffer == other._buffer
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"StringColumn({self.tolist()})"
+
+    @property
+    def nbytes(self) -> int:
+        if self._width is not None:
+            return self._width * self._length
+        return self._offsets[self._length] - self._offsets[0] + (self._length + 1) * 8
+
+    def tolist(self) -> list:
+        return list(self)
+
+    def iter_json(self, chunk_size: int = 65536) -> Iterator[str]:
+        """Yield the canonical JSON array in chunks, straight from the buffer"""
+        yield "["
+        for start in range(0, self._length, chunk_size):
+            if start:
+                yield ","
+            yield ",".join(map(encode_basestring, self[start : start + chunk_size]))
+        yield "]"
+
+
+def _to_column(values):
+    if isinstance(values, (IntColumn, StringColumn)):
+        return values
+    if isinstance(values, array):
+        return IntColumn(values)
+    if not isinstance(values, Sequence) or isinstance(values, (str, bytes)):
+        return values  # not an array; left for validation to reject
+    if values and all(type(v) is int for v in values):
+        try:
+            return IntColumn(values)
+        except OverflowError:  # beyond int64
+            return list(values)
+    if all(isinstance(v, str) for v in values):
+        return StringColumn(values)
+    return list(values)
+
+
+class SeqCol(Mapping):
+    """
+    Level-1 sequence collection with array-backed attributes.
+
+    Integer arrays (lengths) are stored as int64 buffers and string arrays
+    (names, digests) as contiguous UTF-8 buffers, which takes a fraction of
+    the memory of a dict of lists. A SeqCol is read-only and behaves as a
+    mapping of attribute name to array, so it can be passed anywhere a
+    level-1 dict is accepted; SeqColHenge.insert converts it to lists at
+    the henge boundary.
+
+    The FASTA and chrom.sizes loaders still return dicts of lists, so the
+    saving applies once a collection is converted with from_dict, and to
+    collections read with load_seqcol_json or from a catalog.
+    """
+
+    __slots__ = ("_attributes",)
+
+    def __init__(self, attributes: Optional[Mapping] = None, **kwargs):
+        """
+        :param Mapping attributes: level-1 attributes, mapping names to arrays
+        """
+        items = dict(attributes or {}, **kwargs)
+        self._attributes = {k: _to_column(v) for k, v in items.items()}
+
+    @classmethod
+    def from_dict(cls, seqcol_obj: Mapping) -> "SeqCol":
+        """Build a SeqCol from a dict of lists, e.g. the output of fasta_file_to_seqcol"""
+        return cls(seqcol_obj)
+
+    def __getitem__(self, key):
+        return self._attributes[key]
+
+    def __iter__(self):
+        return iter(self._attributes)
+
+    def __len__(self):
+        return len(self._attributes)
+
+    def __repr__(self):
+        return f"SeqCol({self.to_dict()})"
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the attribute buffers"""
+        return sum(getattr(v, "nbytes", 0) for v in self._attributes.values())
+
+    def to_dict(self) -> dict:
+        """Convert to a plain dict of lists"""
+        return {
+            k: v.tolist() if hasattr(v, "tolist") else list(v) if isinstance(v, list) else v
+            for k, v in self._attributes.items()
+        }
+
+    def iter_json(self) -> Iterator[str]:
+        """
+        Yield the JSON representation (sorted keys, no whitespace) in chunks,
+        serialized straight from the attribute buffers.
+        """
+        yield "{"
+        for i, k in enumerate(sorted(self._attributes)):
+            yield ("," if i else "") + encode_basestring(k) + ":"
+            v = self._attributes[k]
+            if hasattr(v, "iter_json"):
+                yield from v.iter_json()
+            else:
+                from .utilities import canonical_str
+
+                yield canonical_str(v)
+        yield "}"
+
+    def to_json(self) -> str:
+        """JSON representation, identical to canonical_str(self.to_dict())"""
+        return "".join(self.iter_json())
@@ -1,5 +1,7 @@
 import os
 
+from .collection import SeqCol
+
 
 def _schema_path(name):
     return os.path.join(SCHEMA_FILEPATH, name)
@@ -46,6 +48,6 @@ ASL_NAME = "AnnotatedSequenceList"
 SCHEMA_NAMES = [ASL_NAME + ".yaml"]
 SCHEMA_FILEPATH = os.path.join(os.path.dirname(__file__), "schemas")
 INTERNAL_SCHEMAS = [_schema_path(s) for s in SCHEMA_NAMES]
-
-# Alias dict to make typehinting clearer
-SeqCol = dict
+# level-1 collections (SeqColArraySet) are stored under their own schema
+SCAS_NAME = "SeqColArraySet"
+SCAS_SCHEMAS = [_schema_path(SCAS_NAME + ".yaml")]
@@ -0,0 +1,320 @@
+"""
+Compare sequence collections to the bit flags defined in const.py, one
+integer per pair of collections, for screening many pairs at once.
+
+The flags of a pair (A, B) describe the level-1 arrays of both:
+
+- CONTENT (sequences), NAMES, LENGTHS and TOPO (topologies)_ALL_A_IN_B /
+  _ALL_B_IN_A: every element of A's array is in B's / of B's in A's
+- CONTENT, NAMES and LENGTHS_ANY_SHARED: the arrays share an element
+- CONTENT_A_ORDER / CONTENT_B_ORDER: at least 2 of A's / B's sequences are
+  in the other collection, and in the same order there
+
+Flags of an attribute are only set if both collections have it.
+"""
+
+from array import array
+from typing import Iterable, Optional, Sequence
+
+from .const import *
+
+try:
+    import numpy as np
+except ImportError:  # pairs are compared one by one
+    np = None
+
+# attribute -> (ALL_A_IN_B, ALL_B_IN_A, ANY_SHARED) flags
+ATTRIBUTE_FLAGS = {
+    "sequences": (CONTENT_ALL_A_IN_B, CONTENT_ALL_B_IN_A, CONTENT_ANY_SHARED),
+    "names": (NAMES_ALL_A_IN_B, NAMES_ALL_B_IN_A, NAMES_ANY_SHARED),
+    "lengths": (LENGTHS_ALL_A_IN_B, LENGTHS_ALL_B_IN_A, LENGTHS_ANY_SHARED),
+    "topologies": (TOPO_ALL_A_IN_B, TOPO_ALL_B_IN_A, 0),
+}
+ORDER_ATTRIBUTE = "sequences"
+BATCH_SIZE = 2**18  # pairs compared per vectorized block
+# a pair list is compared pair by pair if its queries and references make
+# more than this many times as many combinations as there are pairs
+SPARSE_PAIRS = 8
+
+
+def _profile(collection) -> dict:
+    """Element sets of a collection's arrays, and the first position of each sequence"""
+    profile = {a: set(collection[a]) for a in ATTRIBUTE_FLAGS if a in collection}
+    if ORDER_ATTRIBUTE in collection:
+        sequences = list(collection[ORDER_ATTRIBUTE])
+        first = {}
+        for i, x in enumerate(sequences):
+            first.setdefault(x, i)
+        profile["order"] = (sequences, first)
+    return profile
+
+
+def _in_order(a: tuple, b: tuple) -> bool:
+    """Whether 2 or more of a's sequences are in b, in a's order"""
+    first = b[1]
+    positions = [first[x] for x in a[0] if x in first]
+    return len(positions) > 1 and all(p <= q for p, q in zip(positions, positions[1:]))
+
+
+def _profile_flags(a: dict, b: dict) -> int:
+    flag = 0
+    for attribute, (a_in_b, b_in_a, shared) in ATTRIBUTE_FLAGS.items():
+        if attribute not in a or attribute not in b:
+            continue
+        if a[attribute] <= b[attribute]:
+            flag |= a_in_b
+        if b[attribute] <= a[attribute]:
+            flag |= b_in_a
+        if not a[attribute].isdisjoint(b[attribute]):
+            flag |= shared
+    if "order" in a and "order" in b:
+        if _in_order(a["order"], b["order"]):
+            flag |= CONTENT_A_ORDER
+        if _in_order(b["order"], a["order"]):
+            flag |= CONTENT_B_ORDER
+    return flag
+
+
+def compare_flags(A, B) -> int:
+    """
+    Compare two level-1 collections to an integer of bit flags; see
+    explain_flag to decode it
+
+    :param A: collection A, a dict or SeqCol of arrays
+    :param B: collection B
+    :return int: the flags
+    """
+    return _profile_flags(_profile(A), _profile(B))
+
+
+def _expand(starts, sizes) -> tuple:
+    """
+    Concatenate the index ranges [start, start + size), returning which
+    range each index came from and the index
+    """
+    owner = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)
+    index = np.arange(owner.size, dtype=np.int64) - (np.cumsum(sizes) - sizes)[owner]
+    return owner, index + starts[owner]
+
+
+class _Postings:
+    """For each interned value, the collections holding it: an inverted index"""
+
+    def __init__(self, ids, collections, positions, nvalues: int):
+        order = np.argsort(ids, kind="stable")
+        self.offsets = np.zeros(nvalues + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=nvalues), out=self.offsets[1:])
+        self.collections = collections[order]
+        self.positions = positions[order]
+
+    def lookup(self, ids) -> tuple:
+        """The (element, posting) index pairs of the postings of each of ids"""
+        starts = self.offsets[ids]
+        return _expand(starts, self.offsets[ids + 1] - starts)
+
+
+class _Interned:
+    """
+    The arrays of many collections as integer ids, concatenated per
+    attribute: collection i's ids are ids[offsets[i]:offsets[i + 1]], and
+    its distinct ids, with the position of their first occurrence, are
+    unique_ids[unique_offsets[i]:unique_offsets[i + 1]]
+    """
+
+    def __init__(self, collections: Sequence, vocabularies: dict):
+        self.n = len(collections)
+        self.present, self.sizes = {}, {}
+        self.ids, self.offsets = {}, {}
+        self.unique_ids, self.unique_offsets, self.first_positions = {}, {}, {}
+        for attribute in ATTRIBUTE_FLAGS:
+            vocabulary = vocabularies.setdefault(attribute, {})
+            present, ids, unique_ids, first_positions = [], [], [], []
+            offsets, unique_offsets = [0], [0]
+            for collection in collections:
+                present.append(attribute in collection)
+                values = collection[attribute] if attribute in collection else ()
+                first = {}
+                for i, v in enumerate(values):
+                    id_ = vocabulary.setdefault(v, len(vocabulary))
+                    ids.append(id_)
+                    first.setdefault(id_, i)
+                unique_ids.extend(first)
+                first_positions.extend(first.values())
+                offsets.append(len(ids))
+                unique_offsets.append(len(unique_ids))
+            self.present[attribute] = np.array(present, dtype=bool)
+            self.ids[attribute] = np.array(ids, dtype=np.int64)
+            self.offsets[attribute] = np.array(offsets, dtype=np.int64)
+            self.unique_ids[attribute] = np.array(unique_ids, dtype=np.int64)
+            self.unique_offsets[attribute] = np.array(unique_offsets, dtype=np.int64)
+            self.first_positions[attribute] = np.array(first_positions, dtype=np.int64)
+            self.sizes[attribute] = np.diff(self.unique_offsets[attribute])
+
+    def postings(self, attribute: str, nvalues: int, unique: bool = True) -> _Postings:
+        """
+        Inverted index of the distinct values of the collections, with the
+        position of their first occurrence, or of every occurrence
+        """
+        if unique:
+            ids, offsets = self.unique_ids[attribute], self.unique_offsets[attribute]
+            positions = self.first_positions[attribute]
+        else:
+            ids, offsets = self.ids[attribute], self.offsets[attribute]
+            positions = np.arange(ids.size, dtype=np.int64)
+            positions -= np.repeat(offsets[:-1], np.diff(offsets))
+        collections = np.repeat(np.arange(self.n, dtype=np.int64), np.diff(offsets))
+        return _Postings(ids, collections, positions, nvalues)
+
+    def chunk(self, attribute: str, start: int, end: int, unique: bool = True) -> tuple:
+        """
+        The distinct or all ids of collections start to end, the collection
+        each belongs to, counted from start, and the slice they were read from
+        """
+        if unique:
+            ids, offsets = self.unique_ids[attribute], self.unique_offsets[attribute]
+        else:
+            ids, offsets = self.ids[attribute], self.offsets[attribute]
+        bounds = offsets[start : end + 1]
+        owner = np.repeat(np.arange(end - start, dtype=np.int64), np.diff(bounds))
+        span = slice(bounds[0], bounds[-1])
+        return ids[span], owner, span
+
+
+def _ordered(pair, values, npairs: int):
+    """
+    Pairs with 2 or more values, all non-decreasing, given pair numbers in
+    ascending order and the values of each pair in sequence order
+    """
+    ordered = np.bincount(pair, minlength=npairs) > 1
+    backwards = (pair[1:] == pair[:-1]) & (values[1:] < values[:-1])
+    ordered[pair[1:][backwards]] = False
+    return ordered
+
+
+class _FlagBlocks:
+    """Flags of every (query, reference) pair, computed a block of queries at a time"""
+
+    def __init__(self, queries: Sequence, references: Sequence):
+        vocabularies = {}
+        self.a = _Interned(queries, vocabularies)
+        self.b = _Interned(references, vocabularies)
+        nvalues = {attribute: len(v) for attribute, v in vocabularies.items()}
+        self.postings = {a: self.b.postings(a, n) for a, n in nvalues.items()}
+        self.occurrences = self.b.postings(ORDER_ATTRIBUTE, nvalues[ORDER_ATTRIBUTE], False)
+
+    def block(self, start: int, end: int):
+        """uint16 flags of queries start to end against every reference"""
+        a, b = self.a, self.b
+        nq, nr = end - start, b.n
+        flags = np.zeros((nq, nr), dtype=np.uint16)
+        for attribute, (a_in_b, b_in_a, shared) in ATTRIBUTE_FLAGS.items():
+            present = np.outer(a.present[attribute][start:end], b.present[attribute])
+            if not present.any():
+                continue
+            ids, query, _ = a.chunk(attribute, start, end)
+            element, posting = self.postings[attribute].lookup(ids)
+            pair = query[element] * nr + self.postings[attribute].collections[posting]
+            common = np.bincount(pair, minlength=nq * nr).reshape(nq, nr)
+            flags[present & (common == a.sizes[attribute][start:end, None])] |= a_in_b
+            flags[present & (common == b.sizes[attribute][None, :])] |= b_in_a
+            flags[present & (common > 0)] |= shared
+        present = np.outer(a.present[ORDER_ATTRIBUTE][start:end], b.present[ORDER_ATTRIBUTE])
+        if present.any():
+            flags[present & self._a_order(start, end)] |= CONTENT_A_ORDER
+            flags[present & self._b_order(start, end)] |= CONTENT_B_ORDER
+        return flags
+
+    def _a_order(self, start: int, end: int):
+        # every sequence of A, in A's order, at its first position in B
+        nr = self.b.n
+        ids, query, _ = self.a.chunk(ORDER_ATTRIBUTE, start, end, unique=False)
+        postings = self.postings[ORDER_ATTRIBUTE]
+        element, posting = postings.lookup(ids)
+        pair = query[element] * nr + postings.collections[posting]
+        order = np.argsort(pair, kind="stable")
+        positions = postings.positions[posting][order]
+        ordered = _ordered(pair[order], positions, (end - start) * nr)
+        return ordered.reshape(end - start, nr)
+
+    def _b_order(self, start: int, end: int):
+        # every sequence of B, in B's order, at its first position in A
+        nr = self.b.n
+        ids, query, span = self.a.chunk(ORDER_ATTRIBUTE, start, end)
+        first_positions = self.a.first_positions[ORDER_ATTRIBUTE][span]
+        element, posting = self.occurrences.lookup(ids)
+        pair = query[element] * nr + self.occurrences.collections[posting]
+        order = np.lexsort((self.occurrences.positions[posting], pair))
+        positions = first_positions[element][order]
+        ordered = _ordered(pair[order], positions, (end - start) * nr)
+        return ordered.reshape(end - start, nr)
+
+
+def batch_compare_flags(
+    queries: Sequence,
+    references: Sequence,
+    pairs: Optional[Iterable[tuple]] = None,
+    batch_size: int = BATCH_SIZE,
+):
+    """
+    Compare many pairs of level-1 collections to bit flags, as compare_flags
+    does for one pair.
+
+    With NumPy, the digests, names and lengths of the collections are
+    interned to integers once, and the references indexed by value. The
+    flags of a block of queries against every reference then take a few
+    vectorized operations, whose cost grows with the number of values the
+    pairs share rather than with the size of every collection. A list of
+    pairs that covers few of its queries' and references' combinations, and
+    every list without NumPy, is compared pair by pair with Python sets.
+
+    :param queries: collections A, dicts or SeqCol objects of arrays
+    :param references: collections B
+    :param pairs: (query index, reference index) pairs to compare; by
+        default every query is compared with every reference, query-major
+    :param int batch_size: pairs per vectorized block, bounding memory use
+    :return numpy.ndarray | array.array: uint16 flags, one per pair
+    """
+    if np is None:
+        return _batch_compare_flags_python(queries, references, pairs)
+    if pairs is None:
+        blocks = _FlagBlocks(queries, references)
+        rows = max(1, batch_size // max(1, len(references)))
+        flags = [
+            blocks.block(start, min(start + rows, len(queries))).ravel()
+            for start in range(0, len(queries), rows)
+        ]
+        return np.concatenate(flags) if flags else np.zeros(0, dtype=np.uint16)
+    index = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    if not len(index):
+        return np.zeros(0, dtype=np.uint16)
+    query_ids, query = np.unique(index[:, 0], return_inverse=True)
+    reference_ids, reference = np.unique(index[:, 1], return_inverse=True)
+    if len(query_ids) * len(reference_ids) > SPARSE_PAIRS * len(index):
+        flags = _batch_compare_flags_python(queries, references, index.tolist())
+        return np.frombuffer(flags, dtype=np.uint16).copy()
+    blocks = _FlagBlocks([queries[i] for i in query_ids], [references[i] for i in reference_ids])
+    flags = np.zeros(len(index), dtype=np.uint16)
+    by_query = np.argsort(query, kind="stable")
+    sorted_query = query[by_query]
+    rows = max(1, batch_size // len(reference_ids))
+    for start in range(0, len(query_ids), rows):
+        end = min(start + rows, len(query_ids))
+        lo, hi = np.searchsorted(sorted_query, [start, end])
+        selected = by_query[lo:hi]
+        block = blocks.block(start, end)
+        flags[selected] = block[query[selected] - start, reference[selected]]
+    return flags
+
+
+def _batch_compare_flags_python(queries, references, pairs) -> array:
+    if pairs is None:
+        pairs = ((q, r) for q in range(len(queries)) for r in range(len(references)))
+    a, b = {}, {}
+    flags = array("H")
+    for q, r in pairs:
+        if q not in a:
+            a[q] = _profile(queries[q])
+        if r not in b:
+            b[r] = _profile(references[r])
+        flags.append(_profile_flags(a[q], b[r]))
+    return flags
@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and per-phase timers for the hot paths.
+
+    Counters include bytes_hashed, sequences_processed, validator_calls,
+    catalog_hits, response_cache_hits/misses and db_retrievals (items read
+    from the henge database). Phases include read, hash, canonicalize,
+    validate, compare, seqcol_digest and insert.
+
+    Hooks added with add_hook receive every update as it happens, e.g. to
+    forward metrics to statsd or OpenTelemetry. Set enabled to False to
+    skip all bookkeeping.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        """Zero every counter and timer"""
+        with self._lock:
+            self._counters = defaultdict(int)
+            self._timers = defaultdict(lambda: [0, 0.0])
+
+    def add_hook(self, hook: Callable[[str, str, float], None]):
+        """
+        Register a function called as hook(kind, name, value) on every
+        update, where kind is "counter" or "timer" and value is the
+        increment or the seconds spent
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, str, float], None]):
+        self._hooks.remove(hook)
+
+    def update(self, counters: Optional[dict] = None, timers: Optional[dict] = None):
+        """
+        Add to several counters and timers at once, taking the lock once
+
+        :param dict counters: increments, keyed by counter name
+        :param dict timers: seconds spent, keyed by phase name; each counts
+            as one call of the phase
+        """
+        if not self.enabled:
+            return
+        counters = counters or {}
+        timers = timers or {}
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] += value
+            for phase, seconds in timers.items():
+                timer = self._timers[phase]
+                timer[0] += 1
+                timer[1] += seconds
+        for hook in self._hooks:
+            for name, value in counters.items():
+                hook("counter", name, value)
+            for phase, seconds in timers.items():
+                hook("timer", phase, seconds)
+
+    def increment(self, name: str, value: int = 1):
+        """Add value to a counter"""
+        self.update(counters={name: value})
+
+    @contextmanager
+    def timer(self, phase: str):
+        """
+        Time a block as one call of phase. A phase entered again within
+        itself on the same thread, e.g. by a recursive insert, is only
+        timed at the outermost level.
+        """
+        active = getattr(self._local, "active", None)
+        if active is None:
+            active = self._local.active = set()
+        if not self.enabled or phase in active:
+            yield
+            return
+        active.add(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            active.discard(phase)
+            self.update(timers={phase: time.perf_counter() - start})
+
+    def snapshot(self) -> dict:
+        """
+        Current values, as {"counters": {name: value}, "timers": {phase:
+        {"count": calls, "seconds": total seconds}}}
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timers": {
+                    phase: {"count": count, "seconds": seconds}
+                    for phase, (count, seconds) in self._timers.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "seqcol") -> str:
+        """Render the current values in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        if snapshot["timers"]:
+            metric = f"{prefix}_phase_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for phase, timer in sorted(snapshot["timers"].items()):
+                lines.append(f'{metric}_sum{{phase="{phase}"}} {timer["seconds"]:.6f}')
+                lines.append(f'{metric}_count{{phase="{phase}"}} {timer["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+# process-wide registry updated by the seqcol functions
+METRICS = Metrics()
+
+
+def rate_limited(callback: Callable[[int, int, str], None], interval: float = 1.0):
+    """
+    Wrap a progress callback, callback(done, total, name), so it is called
+    at most once per interval seconds, plus always for the last item. A
+    total of None means the number of items is not known in advance.
+    """
+    last = [-float("inf")]
+    lock = threading.Lock()
+
+    def wrapper(done: int, total: Optional[int], name: str):
+        now = time.monotonic()
+        with lock:
+            if (total is None or done < total) and now - last[0] < interval:
+                return
+            last[0] = now
+        callback(done, total, name)
+
+    return wrapper
+
+
+def print_progress(done: int, total: Optional[int], name: str):
+    """Progress callback printing the latest processed item"""
+    if total is None:
+        print(f"Processed ({done}) {name}")
+    else:
+        print(f"Processed ({done} of {total}) {name}")
@@ -1,16 +1,30 @@
 import henge
+import json
 import logging
+import os
+import threading
 import yacman
 
+from collections.abc import Mapping, Sequence
 from itertools import compress
 
+from .bloom import BloomFilter
+from .catalog import SeqColCatalog, write_catalog
+from .collection import SeqCol
 from .const import *
+from .metrics import METRICS
 from .utilities import *
 
 
 _LOGGER = logging.getLogger(__name__)
 henge.ITEM_TYPE = "_item_type"
 
+# Write generation of each database object, bumped by every SeqColHenge
+# writing to it, so a Bloom filter can tell that another henge in this
+# process has added items without querying the database
+_DATABASE_GENERATIONS = {}
+_GENERATIONS_LOCK = threading.Lock()
+
 
 class SeqColConf(yacman.YAMLConfigManager):
     """
@@ -33,6 +47,102 @@ class SeqColConf(yacman.YAMLConfigManager):
         super(SeqColConf, self).__init__(entries, filepath, yamldata, writable)
 
 
+class LazyMapping(Mapping):
+    """
+    Proxy for a stored object whose attributes are retrieved from the
+    database only when first accessed, then memoized.
+    """
+
+    __slots__ = ("_henge", "_druid", "_reclimit", "_recursive", "_flat", "_cache")
+
+    def __init__(self, henge_obj, druid, reclimit, recursive):
+        self._henge = henge_obj
+        self._druid = druid
+        self._reclimit = reclimit
+        self._recursive = recursive
+        self._flat = None
+        self._cache = {}
+
+    def _flat_item(self):
+        if self._flat is None:
+            self._flat = self._henge.retrieve(self._druid, reclimit=0)
+        return self._flat
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            value = self._flat_item()[key]
+            if key in self._recursive and value != "":
+                value = self._henge.retrieve(value, self._reclimit, lazy=True)
+            self._cache[key] = value
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._flat_item())
+
+    def __len__(self):
+        return len(self._flat_item())
+
+    def __repr__(self):
+        return f"LazyMapping({self._druid})"
+
+    def to_dict(self):
+        """Retrieve every attribute and return a plain dict"""
+        return {k: _materialize(v) for k, v in self.items()}
+
+
+class LazyList(Sequence):
+    """
+    Proxy for a stored array whose elements are retrieved from the database
+    only when first accessed, then memoized.
+    """
+
+    __slots__ = ("_henge", "_druid", "_reclimit", "_flat", "_cache")
+
+    def __init__(self, henge_obj, druid, reclimit):
+        self._henge = henge_obj
+        self._druid = druid
+        self._reclimit = reclimit
+        self._flat = None
+        self._cache = {}
+
+    def _flat_item(self):
+        if self._flat is None:
+            self._flat = self._henge.retrieve(self._druid, reclimit=0)
+        return self._flat
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i not in self._cache:
+            self._cache[i] = self._henge.retrieve(self._flat_item()[i], self._reclimit, lazy=True)
+        return self._cache[i]
+
+    def __len__(self):
+        return len(self._flat_item())
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"LazyList({self._druid})"
+
+    def tolist(self):
+        """Retrieve every element and return a plain list"""
+        return [_materialize(v) for v in self]
+
+
+def _materialize(value):
+    if isinstance(value, LazyMapping):
+        return value.to_dict()
+    if isinstance(value, LazyList):
+        return value.tolist()
+    return value
+
+
 class SeqColHenge(henge.Henge):
     """
     Extension of henge that accommodates collections of sequences.
@@ -63,6 +173,11 @@ class SeqColHenge(henge.Henge):
             henges=henges,
             checksum_function=checksum_function,
         )
+        self.catalog = None
+        self.bloom = None
+        self.bloom_path = None
+        self._bloom_params = None
+        self._bloom_generation = None
         _LOGGER.info("Initializing SeqColHenge")
 
     def load_fasta(self, fa_file, skip_seq=False, topology_default="linear"):
@@ -137,7 +252,134 @@ class SeqColHenge(henge.Henge):
         # _LOGGER.info(B)
         return compare_seqcols(A, B)
 
-    def retrieve(self, druid, reclimit=None, raw=False):
+    def insert(self, item, item_type, reclimit=None):
+        """
+        Insert an item, timed as the "insert" phase of METRICS
+
+        If the database supports batched writes (ShardedDatabase), all the
+        writes of the item are buffered and flushed at once.
+
+        @param item Item to insert; a SeqCol is converted to a dict of lists,
+            as the henge schemas validate JSON arrays
+        @param item_type Name of the schema describing the item
+        @param reclimit Recursion limit; None for no limit
+        """
+        if isinstance(item, SeqCol):
+            item = item.to_dict()
+        batch = getattr(self.database, "batch", None)
+        with METRICS.timer("insert"):
+            if batch is None:
+                return super(SeqColHenge, self).insert(item, item_type, reclimit)
+            with batch():
+                return super(SeqColHenge, self).insert(item, item_type, reclimit)
+
+    def insert_many(self, items, item_type, reclimit=None):
+        """
+        Insert several items, with the writes of all of them flushed at once
+        when the database supports batched writes, e.g. across all shards
+        of a ShardedDatabase in parallel
+
+        @param items Items to insert
+        @param item_type Name of the schema describing the items
+        @param reclimit Recursion limit; None for no limit
+        @return list Digests of the items
+        """
+        batch = getattr(self.database, "batch", None)
+        if batch is None:
+            return [self.insert(item, item_type, reclimit) for item in items]
+        with batch():
+            return [self.insert(item, item_type, reclimit) for item in items]
+
+    def retrieve_many(self, druids, reclimit=None):
+        """
+        Multi-get: retrieve several items, reading each level of nesting
+        with one get_many call on the database, which a ShardedDatabase
+        fans out to all shards in parallel
+
+        @param druids Digests of the items
+        @param reclimit Recursion limit; None for no limit
+        @return dict Items keyed by digest; digests not in the database are omitted
+        """
+        get_many = getattr(self.database, "get_many", None)
+        if get_many is None:
+            database = self.database
+            get_many = lambda keys: {k: database[k] for k in keys if k in database}
+        flat = {}
+        level = {d: reclimit for d in druids}
+        if self.bloom is not None:
+            level = {d: r for d, r in level.items() if not self._bloom_excludes(d)}
+            METRICS.increment("bloom_avoided_lookups", len(set(druids)) - len(level))
+        while level:
+            suffixes = ("", henge.ITEM_TYPE, "_external_string")
+            values = get_many([d + suffix for d in level for suffix in suffixes])
+            METRICS.increment("db_retrievals", len(level))
+            next_level = {}
+            for druid, limit in level.items():
+                if druid + henge.ITEM_TYPE not in values:
+                    continue
+                item_type = values[druid + henge.ITEM_TYPE]
+                item = json.loads(values[druid])
+                external = values.get(druid + "_external_string", "null")
+                if external != "null":
+                    item.update(json.loads(external))
+                flat[druid] = item, item_type
+                for child in self._children(item, item_type, limit):
+                    if child not in flat:
+                        next_level[child] = limit - 1 if isinstance(limit, int) else None
+            level = next_level
+        return {d: self._assemble(d, reclimit, flat) for d in druids if d in flat}
+
+    def _children(self, item, item_type, reclimit):
+        """Digests of the nested items that retrieve would recurse into"""
+        if reclimit == 0:
+            return []
+        schema = self.schemas[item_type]
+        if schema["type"] == "array" and "henge_class" in schema["items"]:
+            return list(item)
+        if schema["type"] == "object" and "recursive" in schema:
+            return [item[k] for k in schema["recursive"] if k in item and item[k] != ""]
+        return []
+
+    def _assemble(self, druid, reclimit, flat):
+        if druid not in flat:
+            raise henge.NotFoundException(druid)
+        item, item_type = flat[druid]
+        if reclimit == 0:
+            return item
+        schema = self.schemas[item_type]
+        next_reclimit = reclimit - 1 if isinstance(reclimit, int) else None
+        if schema["type"] == "array" and "henge_class" in schema["items"]:
+            return [self._assemble(d, next_reclimit, flat) for d in item]
+        if schema["type"] == "object" and "recursive" in schema:
+            item = dict(item)
+            for k in schema["recursive"]:
+                if k in item and item[k] != "":
+                    item[k] = self._assemble(item[k], next_reclimit, flat)
+        return item
+
+    def retrieve(self, druid, reclimit=None, raw=False, lazy=False):
+        """
+        Retrieve an item by its digest
+
+        @param druid Digest of the item
+        @param reclimit Recursion limit; None for no limit
+        @param raw Return the raw stored string
+        @param lazy Return a LazyMapping/LazyList proxy whose attributes or
+            elements are retrieved only when accessed, e.g. so reading
+            names and lengths never fetches sequences
+        """
+        if self.catalog is not None and reclimit == 1 and not raw and druid in self.catalog:
+            METRICS.increment("catalog_hits")
+            return self.catalog[druid]
+        if self.bloom is not None and self._bloom_excludes(druid):
+            METRICS.increment("bloom_avoided_lookups")
+            raise henge.NotFoundException(druid)
+        if lazy and not raw and reclimit != 0:
+            proxy = self._lazy_proxy(druid, reclimit)
+            if proxy is not None:
+                return proxy
+        # henge retrieves nested items through this method, one call per item
+        METRICS.increment("db_retrievals")
         try:
             return super(SeqColHenge, self).retrieve(druid, reclimit, raw)
         except henge.NotFoundException as e:
@@ -152,6 +394,148 @@ class SeqColHenge(henge.Henge):
                     "{} not found in database, or in refget.".format(druid)
                 )
 
+    def _lazy_proxy(self, druid, reclimit):
+        """Build a lazy proxy for a recursive item, or None for a flat one"""
+        try:
+            item_type = self.database[druid + henge.ITEM_TYPE]
+        except KeyError:
+            raise henge.NotFoundException(druid)
+        schema = self.schemas[item_type]
+        next_reclimit = reclimit - 1 if isinstance(reclimit, int) else None
+        if schema["type"] == "object" and schema.get("recursive"):
+            return LazyMapping(self, druid, next_reclimit, schema["recursive"])
+        if schema["type"] == "array" and "henge_class" in schema["items"]:
+            return LazyList(self, druid, next_reclimit)
+        return None
+
+    def _henge_insert(self, druid, string, item_type, external_string, digest_version=None):
+        super(SeqColHenge, self)._henge_insert(
+            druid, string, item_type, external_string, digest_version
+        )
+        key = id(self.database)
+        with _GENERATIONS_LOCK:
+            generation = _DATABASE_GENERATIONS.get(key, 0)
+            _DATABASE_GENERATIONS[key] = generation + 1
+            if self.bloom is not None:
+                self.bloom.add(druid)
+                if self._bloom_generation == generation:
+                    # the filter still holds everything written so far
+                    self._bloom_generation = generation + 1
+
+    def enable_bloom_filter(self, path=None, error_rate=0.001, capacity=100_000):
+        """
+        Check a Bloom filter of the stored digests before any database
+        access, so lookups of digests that are not stored raise
+        NotFoundException without a database round-trip. The filter is
+        updated on insert; avoided lookups are counted in METRICS as
+        bloom_avoided_lookups.
+
+        Inserts by other SeqColHenge objects on the same database object
+        in this process are tracked with an in-memory write generation; a
+        lookup the filter rejects after such an insert rebuilds the filter
+        first. Writes made by other processes, or through another database
+        object over the same storage, cannot be seen this way: call
+        refresh_bloom_filter after them, or keep a single writer.
+
+        @param path File the filter is persisted to with save_bloom_filter.
+            It is loaded if it exists and matches the database size;
+            otherwise the filter is rebuilt from the database keys.
+        @param error_rate Maximum false-positive rate
+        @param capacity Items held before the filter grows; at least twice
+            the number of stored items is used when rebuilding
+        @return BloomFilter The filter
+        """
+        self.bloom_path = path
+        self._bloom_params = capacity, error_rate
+        if path and os.path.exists(path):
+            generation = _DATABASE_GENERATIONS.get(id(self.database), 0)
+            bloom, metadata = BloomFilter.load(path)
+            if metadata.get("database_size") == len(self.database):
+                self.bloom, self._bloom_generation = bloom, generation
+                return bloom
+            _LOGGER.info(f"Bloom filter is out of date; rebuilding: {path}")
+        return self.refresh_bloom_filter()
+
+    def refresh_bloom_filter(self):
+        """
+        Rebuild the Bloom filter from the database keys, e.g. after another
+        process has inserted items
+
+        @return BloomFilter The filter
+        """
+        if self._bloom_params is None:
+            raise ValueError("No Bloom filter enabled")
+        # read first: writes made while the keys are read make it stale again
+        generation = _DATABASE_GENERATIONS.get(id(self.database), 0)
+        suffix = henge.ITEM_TYPE
+        druids = [k[: -len(suffix)] for k in self.database.keys() if k.endswith(suffix)]
+        capacity, error_rate = self._bloom_params
+        bloom = BloomFilter(max(capacity, 2 * len(druids)), error_rate)
+        bloom.update(druids)
+        self.bloom, self._bloom_generation = bloom, generation
+        return bloom
+
+    def _bloom_excludes(self, druid):
+        """Whether druid is certainly not stored, rebuilding a stale filter first"""
+        if druid in self.bloom:
+            return False
+        if _DATABASE_GENERATIONS.get(id(self.database), 0) == self._bloom_generation:
+            return True
+        _LOGGER.info("Another henge wrote to the database; rebuilding the Bloom filter")
+        return druid not in self.refresh_bloom_filter()
+
+    def save_bloom_filter(self, path=None):
+        """
+        Persist the Bloom filter, with the database size used to detect a
+        stale file when it is loaded again
+
+        @param path File to write; the path given to enable_bloom_filter by default
+        """
+        path = path or self.bloom_path
+        if self.bloom is None or not path:
+            raise ValueError("No Bloom filter enabled, or no path to save it to")
+        if _DATABASE_GENERATIONS.get(id(self.database), 0) != self._bloom_generation:
+            self.refresh_bloom_filter()
+        self.bloom.save(path, database_size=len(self.database))
+
+    def collection_digests(self):
+        """
+        List the digests of the level-1 collections (SeqColArraySet items)
+        stored in the database
+        """
+        suffix = henge.ITEM_TYPE
+        return [
+            k[: -len(suffix)]
+            for k in self.database.keys()
+            if k.endswith(suffix) and self.database[k] == SCAS_NAME
+        ]
+
+    def export_catalog(self, path, digests=None):
+        """
+        Export level-1 collections to a memory-mappable columnar catalog file
+
+        @param path Catalog file to write
+        @param digests Collections to export; all stored collections by default
+        @return int Number of collections written
+        """
+        digests = self.collection_digests() if digests is None else digests
+        collections = {d: self.retrieve(d, reclimit=1) for d in digests}
+        return write_catalog(collections, path)
+
+    def load_catalog(self, path):
+        """
+        Serve level-1 retrievals (reclimit=1) from a catalog file
+
+        Only the catalog header is read, so this takes milliseconds whatever
+        the number of collections; the arrays are read from the mapped file
+        on access.
+
+        @param path Catalog file written by export_catalog
+        @return SeqColCatalog The loaded catalog
+        """
+        self.catalog = SeqColCatalog(path)
+        return self.catalog
+
     def load_fasta_from_refgenie(self, rgc, refgenie_key):
         """
         @param rgc RefGenConf object
@@ -160,20 +544,52 @@ class SeqColHenge(henge.Henge):
         filepath = rgc.seek(refgenie_key, "fasta")
         return self.load_fasta_from_filepath(filepath)
 
-    def load_fasta_from_filepath(self, filepath):
+    def load_fasta_from_filepath(self, filepath, threads=1, fai_cache_dir=None):
         """
+        Read a FASTA in a single pass if it has no index; see fasta_file_to_seqcol
+
         @param filepath Path to fasta file
+        @param threads Number of threads digesting sequences of an indexed
+            FASTA; a FASTA without an index is read sequentially
+        @param fai_cache_dir Directory for the .fai of a FASTA without one,
+            e.g. when the FASTA is on a read-only mount
+        @return dict The FASTA path, the collection and its digest, and
+            fa_object, a pyfaidx.Fasta opened on the index, or None if the
+            FASTA has none, e.g. a gzipped FASTA without a .gzi
         """
-        fa_object = parse_fasta(filepath)
-        SCAS = fasta_obj_to_seqcol(fa_object, digest_function=self.checksum_function)
-        digest = self.insert(SCAS, "SeqColArraySet", reclimit=1)
+        SCAS = fasta_file_to_seqcol(
+            filepath,
+            threads=threads,
+            fai_cache_dir=fai_cache_dir,
+            digest_function=self.checksum_function,
+        )
+        digest = self.insert(SCAS, SCAS_NAME, reclimit=1)
+        # opening an indexed FASTA only reads its .fai
+        fai = find_fai(filepath, fai_cache_dir)
         return {
             "fa_file": filepath,
-            "fa_object": fa_object,
+            "fa_object": parse_fasta(filepath, fai_cache_dir) if fai else None,
             "SCAS": SCAS,
             "digest": digest,
         }
 
+    def verify_fasta(self, filepath, digest, threads=1, stop_early=True):
+        """
+        Check that a FASTA holds the collection stored under a digest,
+        stopping at the first difference; see verify_fasta
+
+        The stored sequence digests are retrieved only if the names and
+        lengths of the FASTA match.
+
+        @param filepath Path to fasta file
+        @param digest Digest of the expected collection
+        @param threads Number of threads hashing sequences concurrently
+        @param stop_early Whether to stop at the first difference
+        @return dict Verification report
+        """
+        expected = self.retrieve(digest, reclimit=1, lazy=True)
+        return verify_fasta(filepath, expected, threads=threads, stop_early=stop_early)
+
     def load_from_chromsizes(self, chromsizes):
         """
         @param chromsizes Path to chromsizes file
@@ -181,7 +597,7 @@ class SeqColHenge(henge.Henge):
         SCAS = chrom_sizes_to_seqcol(
             chromsizes, digest_function=self.checksum_function
         )
-        digest = self.insert(SCAS, "SeqColArraySet", reclimit=1)
+        digest = self.insert(SCAS, SCAS_NAME, reclimit=1)
         return {
             "chromsizes_file": chromsizes,
             "SCAS": SCAS,
@@ -0,0 +1,297 @@
+import json
+import logging
+import re
+import threading
+
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import parse_qs, urlsplit
+
+import henge
+
+from .exceptions import InvalidSeqColError
+from .metrics import METRICS
+from .seqcol import SeqColHenge
+from .utilities import canonical_str, compare_seqcols, iter_canonical_str, load_seqcol_json
+
+_LOGGER = logging.getLogger(__name__)
+
+COLLECTION_PATH = re.compile(r"^/collection/([^/]+)$")
+COMPARISON_PATH = re.compile(r"^/comparison/([^/]+)(?:/([^/]+))?$")
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class _ResponseCache:
+    """Thread-safe LRU cache of serialized responses"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                METRICS.increment("response_cache_misses")
+                return None
+            METRICS.increment("response_cache_hits")
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class _ChunkedBody:
+    """File-like reader of a request body sent with chunked transfer encoding"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.left = 0
+        self.done = False
+
+    def read(self, size: int = -1) -> bytes:
+        if self.done:
+            return b""
+        if not self.left:
+            line = self.fp.readline(65537)
+            try:
+                self.left = int(line.split(b";", 1)[0], 16)
+            except ValueError:
+                raise ValueError(f"Malformed chunk size: {line!r}")
+            if not self.left:
+                # skip the trailer section up to the final blank line
+                while self.fp.readline(65537) not in (b"\r\n", b"\n", b""):
+                    pass
+                self.done = True
+                return b""
+        data = self.fp.read(self.left if size < 0 else min(size, self.left))
+        if not data:
+            raise ValueError("Unexpected end of chunked request body")
+        self.left -= len(data)
+        if not self.left:
+            self.fp.readline(3)  # CRLF ending the chunk
+        return data
+
+    def drain(self):
+        """Read the rest of the body, so the connection can be reused"""
+        while self.read(65536):
+            pass
+
+
+class _LimitedBody:
+    """File-like reader of a request body of known Content-Length"""
+
+    def __init__(self, fp, length: int):
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length: {length}")
+        self.fp = fp
+        self.left = length
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.left:
+            return b""
+        data = self.fp.read(self.left if size < 0 else min(size, self.left))
+        if not data:
+            raise ValueError("Unexpected end of request body")
+        self.left -= len(data)
+        return data
+
+    def drain(self):
+        """Read the rest of the body, so the connection can be reused"""
+        while self.read(65536):
+            pass
+
+
+class SeqColService:
+    """
+    Reference sequence collections API over a SeqColHenge.
+
+    Endpoints:
+        GET  /collection/{digest}?level=2  attribute arrays (level 1: attribute digests)
+        GET  /comparison/{digestA}/{digestB}
+        GET  /metrics  METRICS in the Prometheus text format
+        POST /comparison/{digestA}  with a level-2 collection as the JSON body
+
+    Collections and stored-vs-stored comparisons are immutable for a given
+    digest, so responses carry the digests as strong ETags and are cached by
+    clients; comparisons are also cached in memory on the server. Collections
+    are streamed with chunked transfer encoding, never serialized whole, and
+    uploaded collections, sent with a Content-Length or chunked, are parsed
+    as the body is read.
+    """
+
+    def __init__(self, henge_obj: SeqColHenge, cache_size: int = 1024):
+        """
+        :param SeqColHenge henge_obj: henge holding the SeqColArraySet collections
+        :param int cache_size: number of comparison responses kept in memory
+        """
+        self.henge = henge_obj
+        self.cache = _ResponseCache(cache_size)
+
+    def make_server(self, host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+        """Create (but do not start) a threaded HTTP server for this service"""
+        server = ThreadingHTTPServer((host, port), SeqColRequestHandler)
+        server.daemon_threads = True
+        server.service = self
+        return server
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8000):
+        """Serve until interrupted"""
+        server = self.make_server(host, port)
+        _LOGGER.info(f"Serving seqcol API on http://{host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def exists(self, digest: str) -> bool:
+        """Whether an item is stored under digest, checked without retrieving it"""
+        catalog = self.henge.catalog
+        if catalog is not None and digest in catalog:
+            return True
+        return digest + henge.ITEM_TYPE in self.henge.database
+
+    def collection(self, digest: str, level: int):
+        if level == 1:
+            return self.henge.retrieve(digest, reclimit=0)
+        if level == 2:
+            return self.henge.retrieve(digest, reclimit=1)
+        raise ValueError(f"Unsupported level: {level}. Choose 1 or 2.")
+
+    def comparison(self, digestA: str, digestB: str) -> bytes:
+        key = (digestA, digestB)
+        body = self.cache.get(key)
+        if body is None:
+            body = canonical_str(self.henge.compare_digests(digestA, digestB)).encode()
+            self.cache.put(key, body)
+        return body
+
+    def comparison_with(self, digestA: str, collection: dict) -> bytes:
+        A = self.henge.retrieve(digestA, reclimit=1)
+        return canonical_str(compare_seqcols(A, collection)).encode()
+
+
+class SeqColRequestHandler(BaseHTTPRequestHandler):
+    """Request handler for SeqColService; the service is found on the server"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes; without this, delayed ACKs stall
+    # each keep-alive response by tens of milliseconds
+    disable_nagle_algorithm = True
+
+    @property
+    def service(self) -> SeqColService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        _LOGGER.debug(format % args)
+
+    def _not_modified(self, etag: str, *digests) -> bool:
+        """Send 304 if the client has etag and the digests it names are stored"""
+        tags = [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]
+        if etag in tags and all(self.service.exists(d) for d in digests):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        return False
+
+    def _send_json(self, body: bytes, status=HTTPStatus.OK, etag: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json_chunks(self, chunks: Iterator[str], etag: str):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.end_headers()
+        for chunk in chunks:
+            data = chunk.encode()
+            if data:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_metrics(self):
+        body = METRICS.to_prometheus().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message: str):
+        self._send_json(json.dumps({"detail": message}).encode(), status=status)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            match = COLLECTION_PATH.match(url.path)
+            if match:
+                digest = match.group(1)
+                level = int(parse_qs(url.query).get("level", ["2"])[0])
+                etag = f'"{digest}-{level}"'
+                if self._not_modified(etag, digest):
+                    return
+                collection = self.service.collection(digest, level)
+                return self._send_json_chunks(iter_canonical_str(collection), etag)
+            match = COMPARISON_PATH.match(url.path)
+            if match and match.group(2):
+                etag = f'"{match.group(1)}-{match.group(2)}"'
+                if self._not_modified(etag, match.group(1), match.group(2)):
+                    return
+                body = self.service.comparison(match.group(1), match.group(2))
+                return self._send_json(body, etag=etag)
+            if url.path == "/metrics":
+                return self._send_metrics()
+            self._send_error(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        except henge.NotFoundException as e:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Not found: {e}")
+        except ValueError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        match = COMPARISON_PATH.match(url.path)
+        if not match or match.group(2):
+            return self._send_error(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        chunked = "chunked" in self.headers.get("Transfer-Encoding", "").lower()
+        if not chunked and self.headers.get("Content-Length") is None:
+            self.close_connection = True
+            return self._send_error(HTTPStatus.LENGTH_REQUIRED, "Content-Length required")
+        try:
+            # parsed as it is read, into array-backed columns
+            if chunked:
+                request_body = _ChunkedBody(self.rfile)
+            else:
+                request_body = _LimitedBody(self.rfile, int(self.headers["Content-Length"]))
+            collection = load_seqcol_json(request_body)
+            request_body.drain()
+            body = self.service.comparison_with(match.group(1), collection)
+            self._send_json(body)
+        except henge.NotFoundException as e:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Not found: {e}")
+        except InvalidSeqColError as e:
+            errors = "; ".join(error.message for error in e.errors)
+            self._send_error(HTTPStatus.BAD_REQUEST, f"Invalid collection: {errors}")
+        except ValueError as e:
+            # the rest of a malformed body is unread
+            self.close_connection = True
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
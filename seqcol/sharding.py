@@ -0,0 +1,321 @@
+import bisect
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# henge stores each item under its digest plus these suffixed keys
+HENGE_KEY_SUFFIXES = ("_item_type", "_digest_version", "_external_string")
+VIRTUAL_NODES = 64
+_SQLITE_BATCH = 500
+
+
+def _ring_position(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def druid_of(key: str) -> str:
+    """The digest a henge database key belongs to, e.g. "abc" for "abc_item_type" """
+    for suffix in HENGE_KEY_SUFFIXES:
+        if key.endswith(suffix):
+            return key[: -len(suffix)]
+    return key
+
+
+class SQLiteStore(MutableMapping):
+    """
+    Dict-like henge database in a SQLite file, with bulk get_many/set_many
+    operations that take one query or transaction per batch of keys.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param str path: database file; created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS henge (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def __getitem__(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM henge WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO henge VALUES (?, ?)", (key, value))
+
+    def __delitem__(self, key):
+        with self._lock:
+            if not self._conn.execute("DELETE FROM henge WHERE key = ?", (key,)).rowcount:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            query = "SELECT 1 FROM henge WHERE key = ?"
+            return self._conn.execute(query, (key,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            keys = [row[0] for row in self._conn.execute("SELECT key FROM henge")]
+        return iter(keys)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM henge").fetchone()[0]
+
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """Values of the keys that exist, fetched _SQLITE_BATCH keys per query"""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_BATCH):
+                chunk = keys[start : start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"SELECT key, value FROM henge WHERE key IN ({placeholders})"
+                found.update(self._conn.execute(query, chunk))
+        return found
+
+    def set_many(self, items: Mapping):
+        """Write many items in a single transaction"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                query = "INSERT OR REPLACE INTO henge VALUES (?, ?)"
+                self._conn.executemany(query, items.items())
+
+    def delete_many(self, keys: Iterable[str]):
+        """Delete many keys in a single transaction; missing keys are ignored"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM henge WHERE key = ?", ((k,) for k in keys))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _get_many(store, keys: list) -> dict:
+    if hasattr(store, "get_many"):
+        return store.get_many(keys)
+    return {k: store[k] for k in keys if k in store}
+
+
+def _set_many(store, items: dict):
+    if hasattr(store, "set_many"):
+        store.set_many(items)
+    else:
+        store.update(items)
+
+
+def _delete_many(store, keys: list):
+    if hasattr(store, "delete_many"):
+        store.delete_many(keys)
+    else:
+        for k in keys:
+            del store[k]
+
+
+class ShardedDatabase(MutableMapping):
+    """
+    Dict-like henge database that spreads items over several stores.
+
+    Each item is routed by its digest on a consistent hash ring, so every
+    key of an item (digest, digest_item_type, ...) lands on the same store,
+    and adding a store moves only about 1/N of the items. Bulk reads and
+    writes are grouped by store and run on all stores concurrently.
+
+    Pass it as the database of a SeqColHenge:
+
+        db = ShardedDatabase({f"shard{i}": SQLiteStore(f"shard{i}.db") for i in range(4)})
+        scc = SeqColHenge(database=db, schemas=SCAS_SCHEMAS)
+    """
+
+    def __init__(self, shards, virtual_nodes: int = VIRTUAL_NODES):
+        """
+        :param shards: dict-like stores keyed by a stable shard name, or a list
+            of stores, named shard0, shard1, ... in order. Ring positions
+            derive from the names, so keep them stable across restarts.
+        :param int virtual_nodes: ring positions per shard; more spread
+            items more evenly
+        """
+        if not isinstance(shards, Mapping):
+            shards = {f"shard{i}": store for i, store in enumerate(shards)}
+        if not shards:
+            raise ValueError("ShardedDatabase needs at least one shard")
+        self.virtual_nodes = virtual_nodes
+        self.shards = {}
+        self._ring = []
+        self._local = threading.local()
+        self._executor = None
+        for name, store in shards.items():
+            self._add_to_ring(name, store)
+
+    def _add_to_ring(self, name: str, store):
+        if name in self.shards:
+            raise ValueError(f"Duplicate shard name: {name}")
+        self.shards[name] = store
+        for i in range(self.virtual_nodes):
+            bisect.insort(self._ring, (_ring_position(f"{name}#{i}"), name))
+
+    def shard_name(self, key: str) -> str:
+        """Name of the shard holding key"""
+        i = bisect.bisect(self._ring, (_ring_position(druid_of(key)),))
+        return self._ring[i % len(self._ring)][1]
+
+    def shard_for(self, key: str):
+        """Store holding key"""
+        return self.shards[self.shard_name(key)]
+
+    def _group(self, keys: Iterable[str]) -> dict:
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.shard_name(key), []).append(key)
+        return groups
+
+    def _fan_out(self, fn, groups: dict) -> list:
+        """Run fn(store, group) for every shard's group, concurrently when there are several"""
+        if len(groups) <= 1:
+            return [fn(self.shards[name], group) for name, group in groups.items()]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self.shards), thread_name_prefix="seqcol-shard"
+            )
+        futures = [
+            self._executor.submit(fn, self.shards[name], group) for name, group in groups.items()
+        ]
+        return [f.result() for f in futures]
+
+    @property
+    def _buffer(self) -> Optional[dict]:
+        return getattr(self._local, "buffer", None)
+
+    def __getitem__(self, key):
+        buffer = self._buffer
+        if buffer is not None and key in buffer:
+            return buffer[key]
+        return self.shard_for(key)[key]
+
+    def __setitem__(self, key, value):
+        buffer = self._buffer
+        if buffer is not None:
+            buffer[key] = value
+        else:
+            self.shard_for(key)[key] = value
+
+    def __delitem__(self, key):
+        buffer = self._buffer
+        if buffer is not None:
+            buffer.pop(key, None)
+        del self.shard_for(key)[key]
+
+    def __contains__(self, key):
+        buffer = self._buffer
+        return (buffer is not None and key in buffer) or key in self.shard_for(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for store in self.shards.values():
+            yield from store
+
+    def __len__(self):
+        return sum(len(store) for store in self.shards.values())
+
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """Multi-get: values of the keys that exist, read from all shards concurrently"""
+        keys = list(keys)
+        found = {}
+        for result in self._fan_out(_get_many, self._group(keys)):
+            found.update(result)
+        buffer = self._buffer
+        if buffer:
+            found.update((k, buffer[k]) for k in keys if k in buffer)
+        return found
+
+    def set_many(self, items: Mapping):
+        """Bulk write, grouped by shard and written to all shards concurrently"""
+        groups = {}
+        for key, value in items.items():
+            groups.setdefault(self.shard_name(key), {})[key] = value
+        self._fan_out(_set_many, groups)
+
+    @contextmanager
+    def batch(self):
+        """
+        Buffer the writes made in this thread within the block, then write
+        them with one set_many on exit. Nested blocks flush with the
+        outermost one; nothing is written if the block raises.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.buffer = {}
+        self._local.depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            if depth == 0:
+                self._local.buffer = None
+            raise
+        finally:
+            self._local.depth = depth
+        if depth == 0:
+            buffer, self._local.buffer = self._local.buffer, None
+            self.set_many(buffer)
+
+    def add_shard(self, name: str, store, rebalance: bool = True) -> int:
+        """
+        Add a store to the ring
+
+        :param str name: stable name of the new shard
+        :param store: dict-like store
+        :param bool rebalance: move the items the new shard now owns into it
+        :return int: number of keys moved
+        """
+        self._add_to_ring(name, store)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        return self.rebalance() if rebalance else 0
+
+    def rebalance(self) -> int:
+        """
+        Move every key that is not on the shard the ring assigns it to
+
+        :return int: number of keys moved
+        """
+        moved = 0
+        for name, store in list(self.shards.items()):
+            misplaced = {}
+            for key in list(store):
+                owner = self.shard_name(key)
+                if owner != name:
+                    misplaced.setdefault(owner, []).append(key)
+            for owner, keys in misplaced.items():
+                _set_many(self.shards[owner], _get_many(store, keys))
+                _delete_many(store, keys)
+                moved += len(keys)
+        _LOGGER.info(f"Rebalanced {moved} keys across {len(self.shards)} shards")
+        return moved
+
+    def close(self):
+        """Close the stores that can be closed and stop the worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for store in self.shards.values():
+            if hasattr(store, "close"):
+                store.close()
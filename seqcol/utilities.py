@@ -1,17 +1,29 @@
 import base64
 import binascii
+import bz2
+import codecs
+import functools
+import gzip
 import hashlib
 import json
 import logging
+import lzma
 import os
-import pyfaidx
+import re
+import struct
+import threading
+import time
 
-from jsonschema import Draft7Validator
-from typing import Optional, Callable
-from yacman import load_yaml
+from array import array
+from collections.abc import Mapping, Sequence
+from contextlib import nullcontext
+from json.encoder import encode_basestring
+from typing import Callable, Iterable, Iterator, Optional
 
-from .const import SeqCol
+from .collection import IntColumn, SeqCol, StringColumn
+from .const import FLAGS
 from .exceptions import *
+from .metrics import METRICS, print_progress, rate_limited
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -30,6 +42,58 @@ def sha512t24u_digest(seq: str, offset: int = 24) -> str:
     return tdigest_b64us.decode("ascii")
 
 
+SEQUENCE_DIGEST_ATTRIBUTES = {
+    "md5": "md5_sequences",
+    "trunc512": "trunc512_sequences",
+}
+
+
+DIGEST_CHUNK_SIZE = 2**22  # bytes of sequence hashed per read
+
+
+def _new_hashers(algorithms) -> dict:
+    """Create one incremental hash object per underlying hash function"""
+    unknown = set(algorithms) - {"sha512t24u", "md5", "trunc512"}
+    if unknown:
+        raise ValueError(f"Unknown digest algorithm(s): {', '.join(sorted(unknown))}")
+    hashers = {}
+    # sha512t24u and trunc512 are both truncations of the same SHA-512 hash
+    if "sha512t24u" in algorithms or "trunc512" in algorithms:
+        hashers["sha512"] = hashlib.sha512()
+    if "md5" in algorithms:
+        hashers["md5"] = hashlib.md5()
+    return hashers
+
+
+def _finalize_hashers(hashers: dict, algorithms, offset: int = 24) -> dict:
+    """Turn incremental hash objects into digests keyed by algorithm name"""
+    digests = {}
+    if "sha512" in hashers:
+        sha512 = hashers["sha512"].digest()[:offset]
+        if "sha512t24u" in algorithms:
+            digests["sha512t24u"] = base64.urlsafe_b64encode(sha512).decode("ascii")
+        if "trunc512" in algorithms:
+            digests["trunc512"] = binascii.hexlify(sha512).decode()
+    if "md5" in hashers:
+        digests["md5"] = hashers["md5"].hexdigest()
+    return digests
+
+
+def multi_digest(seq: bytes, algorithms=("sha512t24u",), offset: int = 24) -> dict:
+    """
+    Compute several digests of a sequence from a single read of its bytes.
+
+    :param bytes seq: the encoded sequence
+    :param algorithms: any of "sha512t24u", "md5" and "trunc512"
+    :param int offset: number of bytes kept by the truncated digests
+    :return dict: digests keyed by algorithm name
+    """
+    hashers = _new_hashers(algorithms)
+    for hasher in hashers.values():
+        hasher.update(seq)
+    return _finalize_hashers(hashers, algorithms, offset)
+
+
 def canonical_str(item: dict) -> str:
     """Convert a dict into a canonical string representation"""
     return json.dumps(
@@ -37,9 +101,346 @@ def canonical_str(item: dict) -> str:
     )
 
 
-def print_csc(csc: dict) -> str:
-    """Convenience function to pretty-print a canonical sequence collection"""
-    return print(json.dumps(csc, indent=2))
+CANONICAL_CHUNK_SIZE = 65536  # array elements serialized per chunk
+
+# Reused by the fast serializers, so each call skips building a new encoder
+_CANONICAL_ENCODER = json.JSONEncoder(
+    separators=(",", ":"), ensure_ascii=False, allow_nan=False, sort_keys=True
+)
+
+
+def canonical_name_length_pair(name: str, length: int) -> str:
+    """
+    Canonical string of a {length, name} object, without building the dict.
+
+    Byte-identical to canonical_str({"length": length, "name": name}) for an
+    int length and str name: RFC-8785 writes integers in decimal, escapes
+    strings as json does with ensure_ascii=False, and sorts "length" before
+    "name".
+    """
+    return '{"length":' + int.__repr__(length) + ',"name":' + encode_basestring(name) + "}"
+
+
+def iter_canonical_str(item, chunk_size: int = CANONICAL_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the canonical string representation of a seqcol value in chunks.
+
+    Objects are serialized key by key and arrays chunk_size elements at a
+    time with a shared encoder, so neither a million-element array nor a
+    whole collection ever exists as one string. Joining the chunks gives
+    exactly canonical_str(item).
+    """
+    if isinstance(item, (IntColumn, StringColumn)):
+        yield from item.iter_json(chunk_size)
+    elif isinstance(item, Mapping) and all(isinstance(k, str) for k in item):
+        yield "{"
+        for i, k in enumerate(sorted(item)):
+            yield ("," if i else "") + encode_basestring(k) + ":"
+            yield from iter_canonical_str(item[k], chunk_size)
+        yield "}"
+    elif isinstance(item, list) and len(item) > chunk_size:
+        yield "["
+        for start in range(0, len(item), chunk_size):
+            if start:
+                yield ","
+            yield _CANONICAL_ENCODER.encode(item[start : start + chunk_size])[1:-1]
+        yield "]"
+    elif isinstance(item, Sequence) and not isinstance(item, (list, str, bytes, bytearray)):
+        # e.g. lazy proxies, whose elements may be proxies themselves
+        yield "["
+        for i, element in enumerate(item):
+            if i:
+                yield ","
+            yield from iter_canonical_str(element, chunk_size)
+        yield "]"
+    else:
+        yield _CANONICAL_ENCODER.encode(item)
+
+
+def fast_canonical_str(item) -> str:
+    """Drop-in replacement for canonical_str, fast for seqcol arrays"""
+    return "".join(iter_canonical_str(item))
+
+
+def canonical_digest(item, offset: int = 24) -> str:
+    """
+    Compute sha512t24u_digest(canonical_str(item)), feeding the hasher each
+    serialized chunk as it is produced instead of building the whole string.
+    """
+    hasher = hashlib.sha512()
+    for chunk in iter_canonical_str(item):
+        hasher.update(chunk.encode())
+    return base64.urlsafe_b64encode(hasher.digest()[:offset]).decode("ascii")
+
+
+def _plain_json(obj):
+    """json.dumps default converting SeqCol objects and lazy proxies"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, Sequence) and not isinstance(obj, (str, bytes, bytearray)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def print_csc(csc: Mapping) -> None:
+    """
+    Convenience function to pretty-print a canonical sequence collection,
+    e.g. a dict, SeqCol or lazy proxy
+    """
+    print(json.dumps(csc, indent=2, default=_plain_json))
+
+
+def write_json_chunks(chunks: Iterable[str], fp) -> int:
+    """
+    Write serialized JSON chunks, e.g. from iter_canonical_str, to a text or
+    binary file-like object (such as socket.makefile("wb")) as they are produced.
+
+    :return int: number of characters written
+    """
+    binary = not hasattr(fp, "encoding")
+    written = 0
+    for chunk in chunks:
+        fp.write(chunk.encode() if binary else chunk)
+        written += len(chunk)
+    return written
+
+
+def iter_itemwise_json(csc: SeqCol, chunk_size: int = CANONICAL_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the canonical JSON of format_itemwise(csc) in chunks, building at
+    most chunk_size per-sequence objects at a time.
+    """
+    n = len(csc["lengths"])
+    yield '{"sequences":['
+    for start in range(0, n, chunk_size):
+        if start:
+            yield ","
+        end = min(start + chunk_size, n)
+        yield _CANONICAL_ENCODER.encode(
+            [
+                {"name": name, "length": length, "sequence": sequence}
+                for name, length, sequence in zip(
+                    csc["names"][start:end], csc["lengths"][start:end], csc["sequences"][start:end]
+                )
+            ]
+        )[1:-1]
+    yield "]}"
+
+
+_JSON_DECODER = json.JSONDecoder()
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_INT64_MIN, _INT64_MAX = -(2**63), 2**63 - 1
+
+
+class _JSONStream:
+    """Incremental reader of JSON values from a file-like object"""
+
+    def __init__(self, fp, chunk_size: int, limit: Optional[int]):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.remaining = limit
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        size = self.chunk_size
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        data = self.fp.read(size) if size else b""
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        if isinstance(data, str):
+            data = data.encode()
+        text = self.decoder.decode(data, final=not data)
+        self.eof = not data
+        self.buffer = self.buffer[self.pos :] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Malformed JSON: expected '{char}', got '{self.peek()}'")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number that runs to the end of the buffer may continue in the
+            # next read, e.g. "12" of "12.5e3"
+            if type(value) in (int, float) and not self.eof:
+                number_end = end
+                while number_end < len(self.buffer) and self.buffer[number_end] in _NUMBER_CHARS:
+                    number_end += 1
+                if number_end == len(self.buffer):
+                    self._fill()
+                    continue
+            self.pos = end
+            return value
+
+
+class _ArrayBuilder:
+    """
+    Accumulates array elements straight into an int64 or UTF-8 buffer,
+    falling back to a list for arrays of other or mixed types
+    """
+
+    def __init__(self):
+        self.ints = array("q")
+        self.buffer = bytearray()
+        self.offsets = array("q", [0])
+        self.widths = set()
+        self.items = None
+        self.kind = None
+
+    def add(self, value):
+        if type(value) is int:
+            kind = int if _INT64_MIN <= value <= _INT64_MAX else None
+        else:
+            kind = str if isinstance(value, str) else None
+        if self.kind is None and self.items is None:
+            self.kind = kind
+            if kind is None:
+                self.items = []
+        elif kind is not self.kind and self.items is None:
+            self.items = list(self.build())
+        if self.items is not None:
+            self.items.append(value)
+        elif kind is int:
+            self.ints.append(value)
+        else:
+            encoded = value.encode()
+            self.buffer += encoded
+            self.offsets.append(len(self.buffer))
+            self.widths.add(len(encoded))
+
+    def build(self):
+        if self.items is not None:
+            return self.items
+        if self.kind is int:
+            return IntColumn(self.ints)
+        if self.kind is str:
+            n = len(self.offsets) - 1
+            if len(self.widths) == 1:
+                return StringColumn.from_buffer(
+                    bytes(self.buffer), n, width=next(iter(self.widths))
+                )
+            return StringColumn.from_buffer(bytes(self.buffer), n, offsets=self.offsets)
+        return []
+
+
+def load_seqcol_json(fp, chunk_size: int = 65536, limit: Optional[int] = None) -> SeqCol:
+    """
+    Parse an uploaded level-2 collection from a file-like object incrementally.
+
+    The body is read chunk_size bytes at a time, and array elements are
+    appended straight into array-backed columns, so neither the raw body
+    nor a dict of Python lists is ever held in memory.
+
+    :param fp: binary or text file-like object, e.g. a request body stream
+    :param int chunk_size: bytes read at a time
+    :param int limit: number of bytes to read at most, e.g. the Content-Length
+    :return SeqCol: the parsed collection
+    :raise ValueError: if the body is not a JSON object
+    """
+    stream = _JSONStream(fp, chunk_size, limit)
+    attributes = {}
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.pos += 1
+        return SeqCol(attributes)
+    while True:
+        key = stream.value()
+        if not isinstance(key, str):
+            raise ValueError("JSON object keys must be strings")
+        stream.expect(":")
+        if stream.peek() == "[":
+            stream.pos += 1
+            builder = _ArrayBuilder()
+            if stream.peek() == "]":
+                stream.pos += 1
+            else:
+                while True:
+                    builder.add(stream.value())
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                    else:
+                        stream.expect("]")
+                        break
+            attributes[key] = builder.build()
+        else:
+            attributes[key] = stream.value()
+        if stream.peek() == ",":
+            stream.pos += 1
+        else:
+            stream.expect("}")
+            break
+    return SeqCol(attributes)
+
+
+def _is_array(checker, instance) -> bool:
+    return isinstance(instance, Sequence) and not isinstance(instance, (str, bytes, bytearray))
+
+
+def _is_object(checker, instance) -> bool:
+    return isinstance(instance, Mapping)
+
+
+@functools.lru_cache(maxsize=None)
+def _validator_class():
+    """
+    Draft 7 validator that also accepts array-backed SeqCol objects and lazy
+    proxies. jsonschema is imported on first use, not with the package.
+    """
+    from jsonschema import Draft7Validator, validators
+
+    return validators.extend(
+        Draft7Validator,
+        type_checker=Draft7Validator.TYPE_CHECKER.redefine_many(
+            {"array": _is_array, "object": _is_object}
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def seqcol_schema() -> dict:
+    """
+    The seqcol schema shipped with the package, loaded once per process;
+    treat it as read-only
+    """
+    from yacman import load_yaml
+
+    return load_yaml(os.path.join(os.path.dirname(__file__), "schemas", "seqcol.yaml"))
+
+
+@functools.lru_cache(maxsize=None)
+def _seqcol_validator():
+    """Validator for the seqcol schema, loaded once per process"""
+    return _validator_class()(seqcol_schema())
+
+
+def __getattr__(name):
+    if name == "SeqColValidator":
+        return _validator_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def validate_seqcol_bool(seqcol_obj: SeqCol, schema=None) -> bool:
@@ -48,10 +449,10 @@ def validate_seqcol_bool(seqcol_obj: SeqCol, schema=None) -> bool:
 
     To enumerate the errors, use validate_seqcol instead.
     """
-    schema_path = os.path.join(os.path.dirname(__file__), "schemas", "seqcol.yaml")
-    schema = load_yaml(schema_path)
-    validator = Draft7Validator(schema)
-    return validator.is_valid(seqcol_obj)
+    validator = _seqcol_validator()
+    METRICS.increment("validator_calls")
+    with METRICS.timer("validate"):
+        return validator.is_valid(seqcol_obj)
 
 
 def validate_seqcol(seqcol_obj: SeqCol, schema=None) -> Optional[dict]:
@@ -59,10 +460,11 @@ def validate_seqcol(seqcol_obj: SeqCol, schema=None) -> Optional[dict]:
     Returns True if valid, raises InvalidSeqColError if not, which enumerates the errors.
     Retrieve individual errors with exception.errors
     """
-    schema_path = os.path.join(os.path.dirname(__file__), "schemas", "seqcol.yaml")
-    schema = load_yaml(schema_path)
-    validator = Draft7Validator(schema)
-    if not validator.is_valid(seqcol_obj):
+    validator = _seqcol_validator()
+    METRICS.increment("validator_calls")
+    with METRICS.timer("validate"):
+        valid = validator.is_valid(seqcol_obj)
+    if not valid:
         errors = sorted(validator.iter_errors(seqcol_obj), key=lambda e: e.path)
         raise InvalidSeqColError("Validation failed", errors)
     return True
@@ -86,12 +488,127 @@ def format_itemwise(csc: SeqCol) -> list:
     return {"sequences": list_of_dicts}
 
 
-def parse_fasta(fa_file) -> pyfaidx.Fasta:
+# Level-1 attributes the loaders can compute, each from one record per
+# sequence: attribute -> (function(record, digest_function) -> value, record
+# fields it reads, whether its values are sorted). A record holds the
+# sequence's "name" and "length" and, only when a selected attribute reads
+# them, its refget "sequence" digest and its "md5"/"trunc512" digests.
+ATTRIBUTE_FUNCTIONS = {}
+DEFAULT_ATTRIBUTES = ["lengths", "names", "sequences", "sorted_name_length_pairs"]
+# record fields that need the sequence itself
+SEQUENCE_FIELDS = ("sequence", "md5", "trunc512")
+
+
+def register_attribute(
+    name: str,
+    function: Callable[[dict, Callable[[str], str]], object],
+    fields: Iterable[str] = (),
+    sort: bool = False,
+):
+    """
+    Register a function computing a level-1 attribute, so the loaders can
+    compute it in the same pass as the other selected attributes
+
+    :param str name: attribute name
+    :param function(dict, function) function: called as function(record,
+        digest_function) for each sequence, returning its value
+    :param fields: record fields the function reads besides "name" and
+        "length"; any of "sequence", "md5" and "trunc512"
+    :param bool sort: whether to sort the values, for attributes that are
+        not collated with the sequences
+    """
+    unknown = set(fields) - set(SEQUENCE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown record field(s): {', '.join(sorted(unknown))}")
+    ATTRIBUTE_FUNCTIONS[name] = (function, frozenset(fields), sort)
+
+
+def _record_field(field: str):
+    return lambda record, digest_function: record[field]
+
+
+def _name_length_pair_digest(record: dict, digest_function: Callable[[str], str]) -> str:
+    return digest_function(canonical_name_length_pair(record["name"], record["length"]))
+
+
+register_attribute("lengths", _record_field("length"))
+register_attribute("names", _record_field("name"))
+register_attribute("sequences", _record_field("sequence"), ["sequence"])
+register_attribute("md5_sequences", _record_field("md5"), ["md5"])
+register_attribute("trunc512_sequences", _record_field("trunc512"), ["trunc512"])
+register_attribute("sorted_name_length_pairs", _name_length_pair_digest, sort=True)
+# built-in attributes whose columns the chrom.sizes loader fills directly
+_FIELD_COLUMNS = {
+    "lengths": "length",
+    "names": "name",
+    "sequences": "sequence",
+    "md5_sequences": "md5",
+}
+_BUILTIN_ATTRIBUTES = dict(ATTRIBUTE_FUNCTIONS)
+
+
+def select_attributes(
+    schema: Optional[dict] = None,
+    attributes: Optional[Iterable[str]] = None,
+    extra_digests: Optional[list] = None,
+) -> list:
+    """
+    Choose the attributes a loader computes: the requested attributes if
+    given, else the schema's inherent and collated attributes that have a
+    registered function, else DEFAULT_ATTRIBUTES; plus the attributes of any
+    extra digests
+
+    :param dict schema: seqcol schema, e.g. seqcol_schema()
+    :param attributes: names of registered attributes
+    :param list extra_digests: extra sequence digests ("md5", "trunc512")
+    :return list: attribute names
+    :raise ValueError: if an attribute or digest is unknown
+    """
+    if attributes is not None:
+        selected = list(attributes)
+        unknown = [a for a in selected if a not in ATTRIBUTE_FUNCTIONS]
+        if unknown:
+            raise ValueError(f"No function registered for attribute(s): {', '.join(unknown)}")
+    elif schema is not None:
+        wanted = set(schema.get("inherent", []))
+        wanted.update(
+            name for name, spec in schema.get("properties", {}).items() if spec.get("collated")
+        )
+        selected = [a for a in ATTRIBUTE_FUNCTIONS if a in wanted]
+    else:
+        selected = list(DEFAULT_ATTRIBUTES)
+    for algorithm in extra_digests or []:
+        if algorithm not in SEQUENCE_DIGEST_ATTRIBUTES:
+            raise ValueError(f"Unknown digest algorithm: {algorithm}")
+        if SEQUENCE_DIGEST_ATTRIBUTES[algorithm] not in selected:
+            selected.append(SEQUENCE_DIGEST_ATTRIBUTES[algorithm])
+    return selected
+
+
+def _record_fields(attributes: list, sidecar_file: Optional[str] = None) -> set:
+    """Record fields read by the attributes, and the sidecar file if any"""
+    fields = set()
+    for attribute in attributes:
+        fields |= ATTRIBUTE_FUNCTIONS[attribute][1]
+    if sidecar_file:
+        fields |= {"sequence", "md5"}
+    return fields
+
+
+def parse_fasta(fa_file, fai_cache_dir: Optional[str] = None) -> "pyfaidx.Fasta":
     """
     Read in a gzipped or not gzipped FASTA file
+
+    :param str fai_cache_dir: directory holding the .fai, if it is not next to
+        the FASTA; see find_fai. A missing or stale index is written there.
     """
+    import pyfaidx
+
+    indexname = None
+    if fai_cache_dir:
+        indexname = find_fai(fa_file, fai_cache_dir) or fai_cache_path(fa_file, fai_cache_dir)
     try:
-        return pyfaidx.Fasta(fa_file)
+        return pyfaidx.Fasta(fa_file, indexname=indexname)
     except pyfaidx.UnsupportedCompressionFormat:
         # pyfaidx can handle bgzip but not gzip; so we just hack it here and
         # gunzip the file into a temporary one and read it in not to interfere
@@ -112,82 +629,1010 @@ def chrom_sizes_to_digest(chrom_sizes_file_path: str) -> str:
 
 
 def chrom_sizes_to_seqcol(
-        chrom_sizes_file_path: str,
-        digest_function: Callable[[str], str] = sha512t24u_digest,
-        ) -> dict:
-    """Given a chrom.sizes file, return a canonical seqcol object"""
+    chrom_sizes_file_path: str,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+    extra_digests: Optional[list] = None,
+    schema: Optional[dict] = None,
+    attributes: Optional[list] = None,
+) -> dict:
+    """
+    Given a chrom.sizes file, return a canonical seqcol object
+
+    The file has 4 columns: name, length, GA4GH digest and MD5 digest, as
+    written by fasta_obj_to_seqcol's sidecar_file. The digest columns may be
+    left out if no selected attribute needs them.
+
+    :param str chrom_sizes_file_path: path to the chrom.sizes file
+    :param function(str) -> str digest_function: digest function for the name-length pairs
+    :param list extra_digests: extra sequence digests to add as attributes; only
+        "md5" is available from a chrom.sizes file
+    :param dict schema: schema whose attributes to compute; see select_attributes
+    :param list attributes: attributes to compute; see select_attributes
+    """
+    attributes = select_attributes(schema, attributes, extra_digests)
+    fields = _record_fields(attributes)
+    if fields - {"sequence", "md5"}:
+        raise ValueError("Only the 'md5' extra digest is available from a chrom.sizes file")
+
+    columns = {"name": [], "length": [], "sequence": [], "md5": []}
+    names, lengths = columns["name"], columns["length"]
+    sequences, md5s = columns["sequence"], columns["md5"]
     with open(chrom_sizes_file_path, "r") as f:
-        lines = f.readlines()
-    CSC = {"lengths": [], "names": [], "sequences": [], "sorted_name_length_pairs": []}
-    for line in lines:
-        line = line.strip()
-        if line == "":
+        for line in f:
+            values = line.strip().split("\t")
+            if values == [""]:
+                continue
+            names.append(values[0])
+            lengths.append(int(values[1]))
+            if fields:
+                if len(values) < 4:
+                    raise ValueError(f"No sequence digests in {chrom_sizes_file_path}: {line}")
+                sequences.append(values[2])
+                md5s.append(values[3])
+    if any(ATTRIBUTE_FUNCTIONS[a] is not _BUILTIN_ATTRIBUTES.get(a) for a in attributes):
+        keys = [k for k in columns if columns[k]]
+        records = (dict(zip(keys, values)) for values in zip(*(columns[k] for k in keys)))
+        return _records_to_seqcol(records, len(names), digest_function, attributes)
+    # every attribute is built in: fill the columns without per-record dispatch
+    t0 = time.perf_counter()
+    CSC = {}
+    for attribute in attributes:
+        if attribute == "sorted_name_length_pairs":
+            pairs = map(canonical_name_length_pair, names, lengths)
+            CSC[attribute] = sorted(map(digest_function, pairs))
+        else:
+            CSC[attribute] = columns[_FIELD_COLUMNS[attribute]]
+    METRICS.update(timers={"canonicalize": time.perf_counter() - t0})
+    return CSC
+
+
+def names_lengths_to_seqcol(
+    names: list,
+    lengths: list,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+) -> dict:
+    """Given parallel arrays of sequence names and lengths, return a level-1 CSC"""
+    lengths = [int(x) for x in lengths]
+    return {
+        "lengths": lengths,
+        "names": list(names),
+        "sorted_name_length_pairs": build_sorted_name_length_pairs(
+            {"names": names, "lengths": lengths}, digest_function
+        ),
+    }
+
+
+BAM_MAGIC = b"BAM\1"
+BCF_MAGIC = b"BCF"
+CRAM_MAGIC = b"CRAM"
+GZIP_MAGIC = b"\x1f\x8b"
+CRAM_BLOCK_DECOMPRESSORS = {
+    0: lambda data: data,
+    1: gzip.decompress,
+    2: bz2.decompress,
+    3: lzma.decompress,
+}
+
+
+def _open_maybe_gzipped(file_path: str):
+    """Open a plain or (b)gzipped file for binary reading.
+
+    BGZF is a series of gzip members, so the gzip module reads it natively and
+    only inflates the blocks that are actually read.
+    """
+    with open(file_path, "rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(file_path, "rb")
+    return open(file_path, "rb")
+
+
+def _read_exactly(f, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError(f"Unexpected end of file while reading header of '{f.name}'")
+    return data
+
+
+def _read_itf8(f) -> int:
+    """Read a CRAM ITF8-encoded integer"""
+    b0 = _read_exactly(f, 1)[0]
+    if b0 < 0x80:
+        return b0
+    if b0 < 0xC0:
+        rest = _read_exactly(f, 1)
+        return ((b0 & 0x3F) << 8) | rest[0]
+    if b0 < 0xE0:
+        rest = _read_exactly(f, 2)
+        return ((b0 & 0x1F) << 16) | (rest[0] << 8) | rest[1]
+    if b0 < 0xF0:
+        rest = _read_exactly(f, 3)
+        return ((b0 & 0x0F) << 24) | (rest[0] << 16) | (rest[1] << 8) | rest[2]
+    rest = _read_exactly(f, 4)
+    return (
+        ((b0 & 0x0F) << 28) | (rest[0] << 20) | (rest[1] << 12) | (rest[2] << 4) | (rest[3] & 0x0F)
+    )
+
+
+def _read_ltf8(f) -> int:
+    """Read a CRAM LTF8-encoded integer"""
+    b0 = _read_exactly(f, 1)[0]
+    nbytes = 0
+    while nbytes < 8 and b0 & (0x80 >> nbytes):
+        nbytes += 1
+    value = b0 & (0xFF >> (nbytes + 1)) if nbytes < 8 else 0
+    for b in _read_exactly(f, nbytes):
+        value = (value << 8) | b
+    return value
+
+
+def _read_sam_header(file_path: str) -> tuple:
+    """
+    Read only the header of a SAM, BAM or CRAM file
+
+    :return (str, list): SAM-format header text, and for BAM the reference
+        (name, length) pairs of the binary header, else None
+    """
+    with open(file_path, "rb") as f:
+        magic = f.read(4)
+    if magic == CRAM_MAGIC:
+        return _read_cram_header_text(file_path), None
+    with _open_maybe_gzipped(file_path) as f:
+        if f.read(4) == BAM_MAGIC:
+            l_text = struct.unpack("<i", _read_exactly(f, 4))[0]
+            text = _read_exactly(f, l_text).decode().rstrip("\0")
+            references = []
+            for _ in range(struct.unpack("<i", _read_exactly(f, 4))[0]):
+                l_name = struct.unpack("<i", _read_exactly(f, 4))[0]
+                name = _read_exactly(f, l_name).rstrip(b"\0").decode()
+                references.append((name, struct.unpack("<i", _read_exactly(f, 4))[0]))
+            return text, references
+        f.seek(0)
+        lines = []
+        for line in f:
+            if not line.startswith(b"@"):
+                break
+            lines.append(line.decode())
+        return "".join(lines), None
+
+
+def _read_cram_header_text(file_path: str) -> str:
+    """Read the SAM header text stored in the first container of a CRAM file"""
+    with open(file_path, "rb") as f:
+        _read_exactly(f, 4)  # magic
+        major, minor = _read_exactly(f, 2)
+        if major < 2:
+            raise ValueError(f"Unsupported CRAM version {major}.{minor}: '{file_path}'")
+        _read_exactly(f, 20)  # file id
+        # container header
+        _read_exactly(f, 4)  # container length
+        _read_itf8(f)  # reference sequence id
+        _read_itf8(f)  # starting position
+        _read_itf8(f)  # alignment span
+        _read_itf8(f)  # number of records
+        _read_ltf8(f)  # record counter
+        _read_ltf8(f)  # bases
+        _read_itf8(f)  # number of blocks
+        for _ in range(_read_itf8(f)):  # landmarks
+            _read_itf8(f)
+        if major >= 3:
+            _read_exactly(f, 4)  # crc32
+        # first block holds the SAM header
+        method, _content_type = _read_exactly(f, 2)
+        _read_itf8(f)  # content id
+        size = _read_itf8(f)
+        _read_itf8(f)  # raw size
+        if method not in CRAM_BLOCK_DECOMPRESSORS:
+            raise ValueError(
+                f"Unsupported CRAM header block compression method ({method}): '{file_path}'"
+            )
+        data = CRAM_BLOCK_DECOMPRESSORS[method](_read_exactly(f, size))
+    l_text = struct.unpack("<i", data[:4])[0]
+    return data[4 : 4 + l_text].decode().rstrip("\0")
+
+
+def sam_header_to_seqcol(
+    file_path: str,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+) -> dict:
+    """
+    Given a SAM, BAM or CRAM file, return a level-1 CSC built from its @SQ header lines.
+
+    Only the header is read, so this takes the same time for any file size.
+    For BAM, names and lengths come from the binary reference list, which
+    is authoritative even when the header text lacks @SQ lines. The M5 tags
+    hold MD5 digests, not GA4GH digests, so if every sequence has one they
+    are returned as the `md5_sequences` attribute rather than as `sequences`.
+
+    :param str file_path: path to a SAM, BAM or CRAM file
+    :param function(str) -> str digest_function: digest function for the name-length pairs
+    :return dict: level-1 canonical sequence collection
+    :raise ValueError: if an @SQ line lacks its SN or LN tag, or there is none
+    """
+    text, references = _read_sam_header(file_path)
+    # in a BAM, the lengths come from the binary reference list
+    required = ("SN",) if references is not None else ("SN", "LN")
+    names, lengths, md5s = [], [], []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.startswith("@SQ"):
             continue
-        seq_name, seq_length, ga4gh_digest, md5_digest = line.split("\t")
-        snlp = {"length": seq_length, "name": seq_name}  # sorted_name_length_pairs
-        snlp_digest = digest_function(canonical_str(snlp))
-        CSC["lengths"].append(int(seq_length))
-        CSC["names"].append(seq_name)
-        CSC["sequences"].append(ga4gh_digest)
-        CSC["sorted_name_length_pairs"].append(snlp_digest)
-    CSC["sorted_name_length_pairs"].sort()
+        tags = dict(field.split(":", 1) for field in line.split("\t")[1:] if ":" in field)
+        missing = [tag for tag in required if tag not in tags]
+        if missing:
+            raise ValueError(
+                f"@SQ header line {line_number} has no {' or '.join(missing)} tag "
+                f"in '{file_path}'"
+            )
+        names.append(tags["SN"])
+        lengths.append(tags.get("LN"))
+        md5s.append(tags.get("M5"))
+    if references is not None:
+        md5_by_name = dict(zip(names, md5s))
+        names = [name for name, _ in references]
+        lengths = [length for _, length in references]
+        md5s = [md5_by_name.get(name) for name in names]
+    if not names:
+        raise ValueError(f"No @SQ header lines found in '{file_path}'")
+    CSC = names_lengths_to_seqcol(names, lengths, digest_function)
+    if md5s and all(md5s):
+        CSC["md5_sequences"] = md5s
     return CSC
 
 
+VCF_CONTIG_FIELD_RE = re.compile(r'([A-Za-z0-9_]+)=("[^"]*"|[^,>]*)')
+
+
+def vcf_header_to_seqcol(
+    file_path: str,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+) -> dict:
+    """
+    Given a plain or bgzipped VCF file, return a level-1 CSC built from its
+    ##contig header lines. Binary BCF files are not supported.
+
+    Reading stops at the #CHROM line, so no variant records are touched. Contigs
+    without a length are skipped. As for SAM headers, md5 fields are returned as
+    the `md5_sequences` attribute when every contig has one.
+
+    :param str file_path: path to a VCF file
+    :param function(str) -> str digest_function: digest function for the name-length pairs
+    :return dict: level-1 canonical sequence collection
+    """
+    names, lengths, md5s = [], [], []
+    with _open_maybe_gzipped(file_path) as f:
+        if f.read(len(BCF_MAGIC)) == BCF_MAGIC:
+            raise ValueError(f"BCF files are not supported; convert to VCF: '{file_path}'")
+        f.seek(0)
+        for line in f:
+            if not line.startswith(b"##"):
+                break
+            if not line.startswith(b"##contig=<"):
+                continue
+            fields = dict(VCF_CONTIG_FIELD_RE.findall(line.decode().strip()[10:-1]))
+            if "length" not in fields:
+                _LOGGER.warning(f"Skipping contig without length: {fields.get('ID')}")
+                continue
+            names.append(fields["ID"])
+            lengths.append(fields["length"])
+            md5s.append(fields.get("md5"))
+    if not names:
+        raise ValueError(f"No ##contig header lines with a length found in '{file_path}'")
+    CSC = names_lengths_to_seqcol(names, lengths, digest_function)
+    if md5s and all(md5s):
+        CSC["md5_sequences"] = md5s
+    return CSC
+
+
+def sam_header_to_digest(file_path: str) -> str:
+    """Given a SAM, BAM or CRAM file, return a digest of its header contigs"""
+    return seqcol_digest(sam_header_to_seqcol(file_path))
+
+
+def vcf_header_to_digest(file_path: str) -> str:
+    """Given a VCF file, return a digest of its header contigs"""
+    return seqcol_digest(vcf_header_to_seqcol(file_path))
+
+
 def fasta_file_to_digest(fa_file_path: str) -> str:
     """Given a fasta, return a digest"""
     seqcol_obj = fasta_file_to_seqcol(fa_file_path)
     return seqcol_digest(seqcol_obj)
 
 
-def fasta_file_to_seqcol(fa_file_path: str) -> dict:
-    """Given a fasta, return a canonical seqcol object"""
-    fa_obj = parse_fasta(fa_file_path)
-    return fasta_obj_to_seqcol(fa_obj)
+def fasta_file_to_seqcol(
+    fa_file_path: str,
+    extra_digests: Optional[list] = None,
+    sidecar_file: Optional[str] = None,
+    threads: int = 1,
+    verbose: bool = True,
+    fai_cache_dir: Optional[str] = None,
+    schema: Optional[dict] = None,
+    attributes: Optional[list] = None,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+) -> dict:
+    """
+    Given a fasta, return a canonical seqcol object
+
+    An indexed FASTA is read through pyfaidx, on several threads if asked.
+    A FASTA without an up-to-date index is read only once: the .fai records
+    are built in the same pass that hashes the sequences, and written to
+    fai_cache_dir, or else next to the FASTA if that directory is writable,
+    so that the next read can use pyfaidx. Gzipped files are decompressed
+    on the fly and get no .fai. That single pass is sequential, so threads
+    is not used for a FASTA without an index.
+
+    :param str fa_file_path: path to the FASTA, optionally gzipped
+    :param list extra_digests: extra sequence digests ("md5", "trunc512")
+    :param str sidecar_file: path to write a 4-column chrom.sizes file
+    :param int threads: number of threads hashing an indexed FASTA; ignored
+        for a FASTA without an index
+    :param bool verbose: whether to print progress
+    :param str fai_cache_dir: directory for the .fai of FASTA files without
+        one, e.g. when the FASTA is on a read-only mount
+    :param dict schema: schema whose attributes to compute; see select_attributes
+    :param list attributes: attributes to compute; see select_attributes
+    :param function(str) -> str digest_function: digest function for sequences
+        and name-length pairs
+    """
+    if find_fai(fa_file_path, fai_cache_dir) is None:
+        return fasta_file_to_seqcol_single_pass(
+            fa_file_path,
+            digest_function=digest_function,
+            extra_digests=extra_digests,
+            sidecar_file=sidecar_file,
+            verbose=verbose,
+            fai_cache_dir=fai_cache_dir,
+            schema=schema,
+            attributes=attributes,
+        )
+    fa_obj = parse_fasta(fa_file_path, fai_cache_dir=fai_cache_dir)
+    return fasta_obj_to_seqcol(
+        fa_obj,
+        verbose=verbose,
+        digest_function=digest_function,
+        extra_digests=extra_digests,
+        sidecar_file=sidecar_file,
+        threads=threads,
+        schema=schema,
+        attributes=attributes,
+    )
+
+
+def _digest_fasta_record(
+    fa_object: "pyfaidx.Fasta",
+    name: str,
+    algorithms: set,
+    digest_function: Optional[Callable[[str], str]],
+    chunk_size: int = DIGEST_CHUNK_SIZE,
+    stop: Optional[threading.Event] = None,
+) -> Optional[dict]:
+    """
+    Digest one FASTA record, returning a record of its name, length and the
+    requested digests, keyed by algorithm name, with the refget digest also
+    as "sequence".
+
+    The sequence is read and hashed in chunks, so no record is ever held in
+    memory whole, unless a digest_function other than the default is given
+    for the "sequence" digest. hashlib releases the GIL while hashing large
+    buffers, so several records can be digested on concurrent threads. With
+    no algorithms and no digest_function the sequence is not read at all.
+    Chunked digesting gives up, returning None, once stop is set.
+    """
+    clock = time.perf_counter
+    read_time = hash_time = 0.0
+    record = fa_object[name]
+    if digest_function is not None:
+        t0 = clock()
+        seq = str(record).upper()
+        t1 = clock()
+        seq_length = len(seq)
+        digests = multi_digest(seq.encode(), algorithms)
+        digests["sequence"] = "SQ." + digest_function(seq)
+        read_time, hash_time = t1 - t0, clock() - t1
+    elif algorithms:
+        seq_length = len(record)
+        hashers = _new_hashers(algorithms)
+        for start in range(0, seq_length, chunk_size):
+            if stop is not None and stop.is_set():
+                return None
+            t0 = clock()
+            chunk = str(record[start : start + chunk_size]).upper().encode()
+            t1 = clock()
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            read_time += t1 - t0
+            hash_time += clock() - t1
+        t1 = clock()
+        digests = _finalize_hashers(hashers, algorithms)
+        hash_time += clock() - t1
+        if "sha512t24u" in digests:
+            digests["sequence"] = "SQ." + digests["sha512t24u"]
+    else:
+        METRICS.increment("sequences_processed")
+        return {"name": record.name, "length": len(record)}
+    METRICS.update(
+        counters={"sequences_processed": 1, "bytes_hashed": seq_length},
+        timers={"read": read_time, "hash": hash_time},
+    )
+    return {"name": record.name, "length": seq_length, **digests}
 
 
 def fasta_obj_to_seqcol(
-    fa_object: pyfaidx.Fasta,
+    fa_object: "pyfaidx.Fasta",
     verbose: bool = True,
     digest_function: Callable[[str], str] = sha512t24u_digest,
+    extra_digests: Optional[list] = None,
+    sidecar_file: Optional[str] = None,
+    threads: int = 1,
+    progress: Optional[Callable[[int, int, str], None]] = None,
+    schema: Optional[dict] = None,
+    attributes: Optional[list] = None,
 ) -> dict:
     """
     Given a fasta object, return a CSC (Canonical Sequence Collection object)
+
+    Only the selected attributes are computed, all from a single read of
+    each sequence; if none of them needs a sequence digest, the sequences
+    are not read at all and the lengths come from the index.
+
+    :param pyfaidx.Fasta fa_object: the FASTA to digest
+    :param bool verbose: whether to print progress, at most once per second
+    :param function(str) -> str digest_function: digest function for sequences
+        and name-length pairs
+    :param list extra_digests: extra sequence digests ("md5", "trunc512") to add
+        as the md5_sequences/trunc512_sequences attributes
+    :param str sidecar_file: path to write a 4-column chrom.sizes file (name,
+        length, GA4GH digest, MD5 digest) that chrom_sizes_to_seqcol can read
+    :param int threads: number of threads digesting sequences concurrently;
+        1 digests them serially in the calling thread
+    :param function(int, int, str) progress: called as progress(done, total,
+        name) after each sequence; wrap it in rate_limited to throttle it.
+        Defaults to printing when verbose
+    :param dict schema: schema whose attributes to compute; see select_attributes
+    :param list attributes: attributes to compute; see select_attributes
     """
     # CSC = SeqColArraySet
     # Or equivalently, a "Level 1 SeqCol"
 
-    CSC = {"lengths": [], "names": [], "sequences": [], "sorted_name_length_pairs": []}
-    seqs = fa_object.keys()
+    attributes = select_attributes(schema, attributes, extra_digests)
+    algorithms, sequence_function = _fasta_algorithms(
+        _record_fields(attributes, sidecar_file), digest_function
+    )
+    seqs = list(fa_object.keys())
     nseqs = len(seqs)
-    print(f"Found {nseqs} chromosomes")
-    i = 1
-    for k in fa_object.keys():
-        if verbose:
-            print(f"Processing ({i} of {nseqs}) {k}...")
-        seq = str(fa_object[k])
-        seq_length = len(seq)
-        seq_name = fa_object[k].name
-        seq_digest = "SQ."+digest_function(seq.upper())
-        snlp = {"length": seq_length, "name": seq_name}  # sorted_name_length_pairs
-        snlp_digest = digest_function(canonical_str(snlp))
-        CSC["lengths"].append(seq_length)
-        CSC["names"].append(seq_name)
-        CSC["sorted_name_length_pairs"].append(snlp_digest)
-        CSC["sequences"].append(seq_digest)
-        i += 1
-    CSC["sorted_name_length_pairs"].sort()
+    if verbose:
+        print(f"Found {nseqs} chromosomes")
+
+    def digest_record(k):
+        return _digest_fasta_record(fa_object, k, algorithms, sequence_function)
+
+    if threads <= 1 or not (algorithms or sequence_function):
+        return _records_to_seqcol(
+            map(digest_record, seqs),
+            nseqs,
+            digest_function,
+            attributes,
+            sidecar_file,
+            verbose,
+            progress,
+        )
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return _records_to_seqcol(
+            executor.map(digest_record, seqs),
+            nseqs,
+            digest_function,
+            attributes,
+            sidecar_file,
+            verbose,
+            progress,
+        )
+
+
+def _fasta_algorithms(fields: set, digest_function: Callable[[str], str]) -> tuple:
+    """
+    Hash algorithms to run over each sequence for the record fields, and the
+    function computing the "sequence" field from the whole sequence, if the
+    field is needed and digest_function is not the default
+    """
+    algorithms = fields & {"md5", "trunc512"}
+    if "sequence" not in fields:
+        return algorithms, None
+    if digest_function is sha512t24u_digest:
+        return algorithms | {"sha512t24u"}, None
+    return algorithms, digest_function
+
+
+def _records_to_seqcol(
+    records: Iterable[dict],
+    nseqs: Optional[int],
+    digest_function: Callable[[str], str],
+    attributes: list,
+    sidecar_file: Optional[str] = None,
+    verbose: bool = False,
+    progress: Optional[Callable[[int, Optional[int], str], None]] = None,
+) -> dict:
+    """
+    Assemble a CSC of the attributes from sequence records, in record order
+
+    :param int nseqs: number of records, or None if not known in advance
+    """
+    CSC = {attribute: [] for attribute in attributes}
+    functions = [(CSC[a].append, ATTRIBUTE_FUNCTIONS[a][0]) for a in attributes]
+    clock = time.perf_counter
+    canonicalize_time = 0.0
+    if progress is None and verbose:
+        progress = rate_limited(print_progress)
+    with open(sidecar_file, "w") if sidecar_file else nullcontext() as sidecar:
+        for i, record in enumerate(records, 1):
+            if progress:
+                progress(i, nseqs, record["name"])
+            t0 = clock()
+            for append, function in functions:
+                append(function(record, digest_function))
+            canonicalize_time += clock() - t0
+            if sidecar:
+                columns = (record["name"], record["length"], record["sequence"], record["md5"])
+                sidecar.write("\t".join(map(str, columns)) + "\n")
+    METRICS.update(timers={"canonicalize": canonicalize_time})
+    for attribute in attributes:
+        if ATTRIBUTE_FUNCTIONS[attribute][2]:
+            CSC[attribute].sort()
     return CSC
 
 
+def fai_cache_path(fa_file_path: str, fai_cache_dir: str) -> str:
+    """
+    Path of the .fai of a FASTA in a cache directory; the name includes a
+    hash of the FASTA's absolute path, so one directory can cache the
+    indexes of identically named files
+    """
+    abspath = os.path.abspath(fa_file_path)
+    key = hashlib.blake2b(abspath.encode(), digest_size=6).hexdigest()
+    return os.path.join(fai_cache_dir, f"{key}-{os.path.basename(abspath)}.fai")
+
+
+def find_fai(fa_file_path: str, fai_cache_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Find an index of a FASTA that pyfaidx can use: one next to the FASTA or
+    in fai_cache_dir, no older than the FASTA. Gzipped FASTA files also need
+    a .gzi index, which only bgzip-compressed files have.
+
+    :return str: path of the .fai, or None if there is none
+    """
+    if fa_file_path.endswith(".gz") and not os.path.exists(fa_file_path + ".gzi"):
+        return None
+    candidates = [fa_file_path + ".fai"]
+    if fai_cache_dir:
+        candidates.append(fai_cache_path(fa_file_path, fai_cache_dir))
+    mtime = os.path.getmtime(fa_file_path)
+    for path in candidates:
+        if os.path.exists(path) and os.path.getmtime(path) >= mtime:
+            return path
+    return None
+
+
+def _write_fai(
+    fa_file_path: str, fai_lines: list, fai_cache_dir: Optional[str] = None
+) -> Optional[str]:
+    """
+    Write a .fai atomically, skipping it if the directory is not writable
+
+    :return str: path of the .fai, or None if it was not written
+    """
+    if fai_cache_dir:
+        path = fai_cache_path(fa_file_path, fai_cache_dir)
+    else:
+        path = fa_file_path + ".fai"
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if fai_cache_dir:
+            os.makedirs(fai_cache_dir, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.writelines(fai_lines)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        _LOGGER.info(f"Not writing FASTA index {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return path
+
+
+# translates sequence bytes to upper case and drops line breaks in one call
+_UPPER_TABLE = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+
+def _scan_fasta(f, read_size: int = DIGEST_CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Scan a binary FASTA stream in blocks, yielding (header, offset) for each
+    header line, where offset is the position of its first sequence byte,
+    and (None, data) for the raw sequence bytes, line breaks included.
+    """
+    buf = b""
+    pos = 0  # stream offset of buf[0]
+    in_header = False
+    at_line_start = True
+    eof = False
+    while not eof:
+        block = f.read(read_size)
+        eof = not block
+        buf = buf + block if buf else block
+        start = 0
+        while start < len(buf):
+            if in_header:
+                end = buf.find(b"\n", start)
+                if end == -1:
+                    if not eof:
+                        break
+                    end = len(buf)
+                yield buf[start:end].rstrip(b"\r"), pos + min(end + 1, len(buf))
+                start = end + 1
+                in_header = False
+                at_line_start = True
+            elif at_line_start and buf[start : start + 1] == b">":
+                start += 1
+                in_header = True
+            else:
+                end = buf.find(b"\n>", start)
+                if end != -1:
+                    yield None, buf[start : end + 1]
+                    start = end + 2
+                    in_header = True
+                    continue
+                end = len(buf)
+                # hold back a final line break, which may precede a header
+                if not eof and buf.endswith(b"\n"):
+                    end -= 1
+                if end > start:
+                    yield None, buf[start:end]
+                    at_line_start = buf[end - 1 : end] == b"\n"
+                start = end
+                break
+        pos += start
+        buf = buf[start:]
+
+
+class _FastaRecord:
+    """
+    One FASTA record read by fasta_file_to_seqcol_single_pass: its length
+    and digests, and the line layout for its .fai line
+    """
+
+    def __init__(self, name: str, offset: int, algorithms: set, collect: bool):
+        """
+        :param set algorithms: hash algorithms to run over the sequence
+        :param bool collect: whether to keep the sequence, to digest it whole
+        """
+        self.name = name
+        self.offset = offset
+        self.hashers = _new_hashers(algorithms)
+        self.chunks = [] if collect else None
+        self.length = 0
+        self.raw_length = 0
+        self.line_breaks = 0
+        self.line_bases = self.line_width = None
+        self.regular = True
+        self._last_byte = b""
+        self.read_time = self.hash_time = 0.0
+
+    def update(self, data: bytes):
+        t0 = time.perf_counter()
+        offset = self.raw_length
+        self.raw_length += len(data)
+        line_breaks = data.count(b"\n")
+        self.line_breaks += line_breaks
+        if self.line_width is None:
+            end = data.find(b"\n")
+            if end != -1:
+                self.line_width = offset + end + 1
+                cr = (data[end - 1 : end] if end else self._last_byte) == b"\r"
+                self.line_bases = self.line_width - 1 - cr
+        if self.line_width is not None:
+            # every full line ends exactly line_width bytes after the last one
+            first = (self.line_width - 1 - offset) % self.line_width
+            if data[first :: self.line_width].strip(b"\n"):
+                self.regular = False
+        self._last_byte = data[-1:]
+        if not self.hashers and self.chunks is None:
+            # only the length is needed
+            self.length += len(data) - line_breaks - data.count(b"\r")
+            self.read_time += time.perf_counter() - t0
+            return
+        seq = data.translate(_UPPER_TABLE, b"\r\n")
+        self.length += len(seq)
+        t1 = time.perf_counter()
+        for hasher in self.hashers.values():
+            hasher.update(seq)
+        if self.chunks is not None:
+            self.chunks.append(seq)
+        self.read_time += t1 - t0
+        self.hash_time += time.perf_counter() - t1
+
+    def fai_line(self) -> Optional[str]:
+        """The .fai line of the record, or None if its lines vary in length"""
+        if not self.length:
+            return f"{self.name}\t0\t{self.offset}\t0\t0\n"
+        if self.line_width is None:
+            # a single line without a line break, at the end of the file
+            line_bases = line_width = self.length
+        else:
+            line_bases, line_width = self.line_bases, self.line_width
+        if not self.regular or not line_bases:
+            return None
+        eol = line_width - line_bases
+        nlines = -(-self.length // line_bases)
+        expected = self.length + nlines * eol
+        # the last line break is optional
+        layouts = ((expected, nlines), (expected - eol, nlines - 1))
+        if (self.raw_length, self.line_breaks) not in layouts:
+            return None
+        return f"{self.name}\t{self.length}\t{self.offset}\t{line_bases}\t{line_width}\n"
+
+
+def _iter_fasta_records(f, algorithms: set, collect: bool) -> Iterator[_FastaRecord]:
+    """Read the records of a binary FASTA stream in a single pass"""
+    record = None
+    names = set()
+    for header, data in _scan_fasta(f):
+        if header is None:
+            if record is not None:
+                record.update(data)
+            elif data.strip():
+                raise ValueError("FASTA sequence found before the first header line")
+            continue
+        if record is not None:
+            yield record
+        fields = header.decode().split()
+        if not fields:
+            raise ValueError(f"FASTA header without a name, before byte {data}")
+        if fields[0] in names:
+            raise ValueError(f"Duplicate FASTA record name: {fields[0]}")
+        names.add(fields[0])
+        record = _FastaRecord(fields[0], data, algorithms, collect)
+    if record is not None:
+        yield record
+
+
+def fasta_file_to_seqcol_single_pass(
+    fa_file_path: str,
+    digest_function: Callable[[str], str] = sha512t24u_digest,
+    extra_digests: Optional[list] = None,
+    sidecar_file: Optional[str] = None,
+    verbose: bool = True,
+    progress: Optional[Callable[[int, Optional[int], str], None]] = None,
+    fai_cache_dir: Optional[str] = None,
+    write_fai: bool = True,
+    schema: Optional[dict] = None,
+    attributes: Optional[list] = None,
+) -> dict:
+    """
+    Given a fasta, return a CSC, reading the file only once
+
+    The .fai records are built in the same pass that hashes the sequences.
+    Memory use is bounded by the read block size unless digest_function is
+    not the default, in which case each record is held whole while digested.
+    Sequences are only hashed if a selected attribute needs their digests.
+
+    :param str fa_file_path: path to the FASTA, optionally gzipped
+    :param function(str) -> str digest_function: digest function for sequences
+        and name-length pairs
+    :param list extra_digests: extra sequence digests ("md5", "trunc512")
+    :param str sidecar_file: path to write a 4-column chrom.sizes file
+    :param bool verbose: whether to print progress, at most once per second
+    :param function(int, int, str) progress: called as progress(done, None,
+        name) after each sequence, as the total is not known in advance
+    :param str fai_cache_dir: directory to write the .fai to; by default it
+        is written next to the FASTA, if that directory is writable
+    :param bool write_fai: whether to write the .fai; it is never written
+        for gzipped files or files whose lines vary in length within a record
+    :param dict schema: schema whose attributes to compute; see select_attributes
+    :param list attributes: attributes to compute; see select_attributes
+    """
+    attributes = select_attributes(schema, attributes, extra_digests)
+    algorithms, sequence_function = _fasta_algorithms(
+        _record_fields(attributes, sidecar_file), digest_function
+    )
+    collect = sequence_function is not None
+    compressed = fa_file_path.endswith(".gz")
+    fai_lines = []
+
+    def records(f):
+        for record in _iter_fasta_records(f, algorithms, collect):
+            fai_lines.append(record.fai_line())
+            if not (algorithms or collect):
+                METRICS.update(
+                    counters={"sequences_processed": 1}, timers={"read": record.read_time}
+                )
+                yield {"name": record.name, "length": record.length}
+                continue
+            t0 = time.perf_counter()
+            digests = _finalize_hashers(record.hashers, algorithms)
+            if "sha512t24u" in digests:
+                digests["sequence"] = "SQ." + digests["sha512t24u"]
+            elif collect:
+                digests["sequence"] = "SQ." + sequence_function(b"".join(record.chunks).decode())
+            METRICS.update(
+                counters={"sequences_processed": 1, "bytes_hashed": record.length},
+                timers={
+                    "read": record.read_time,
+                    "hash": record.hash_time + time.perf_counter() - t0,
+                },
+            )
+            yield {"name": record.name, "length": record.length, **digests}
+
+    opener = gzip.open if compressed else open
+    with opener(fa_file_path, "rb") as f:
+        csc = _records_to_seqcol(
+            records(f), None, digest_function, attributes, sidecar_file, verbose, progress
+        )
+    if write_fai and not compressed:
+        if None in fai_lines:
+            _LOGGER.warning(f"Not indexing {fa_file_path}: its lines vary in length")
+        else:
+            _write_fai(fa_file_path, fai_lines, fai_cache_dir)
+    return csc
+
+
+def read_fai(fai_path: str) -> tuple:
+    """
+    Read the sequence names and lengths from a .fai
+
+    :return (list, list): names and lengths, in file order
+    """
+    names, lengths = [], []
+    with open(fai_path) as f:
+        for line in f:
+            if line.strip():
+                name, length = line.split("\t")[:2]
+                names.append(name)
+                lengths.append(int(length))
+    return names, lengths
+
+
+def _verify_names_lengths(names: list, lengths: list, expected: Mapping) -> dict:
+    """Verification report of the names and lengths of a FASTA"""
+    expected_names = list(expected["names"])
+    expected_lengths = dict(zip(expected_names, expected["lengths"]))
+    found = set(names)
+    shared = [n for n in names if n in expected_lengths]
+    report = {
+        "match": True,
+        "missing": [n for n in expected_names if n not in found],
+        "unexpected": [n for n in names if n not in expected_lengths],
+        "reordered": shared != [n for n in expected_names if n in found],
+        "length_mismatches": [
+            n for n, length in zip(names, lengths) if expected_lengths.get(n, length) != length
+        ],
+        "sequence_mismatches": [],
+        "sequences_checked": 0,
+    }
+    report["match"] = not (
+        report["missing"]
+        or report["unexpected"]
+        or report["reordered"]
+        or report["length_mismatches"]
+    )
+    return report
+
+
+def verify_fasta(
+    fa_file_path: str,
+    expected: Mapping,
+    threads: int = 1,
+    stop_early: bool = True,
+    fai_cache_dir: Optional[str] = None,
+) -> dict:
+    """
+    Check that a FASTA holds the sequences of a level-1 collection, stopping
+    at the first difference.
+
+    With an index, the names and lengths it lists are checked first, so a
+    renamed, added, removed, reordered or resized sequence is found without
+    reading any sequence. Only then are sequences hashed, on several threads
+    if asked, until one differs. Without an index, the FASTA is read once and
+    each record is checked as soon as it has been read.
+
+    :param str fa_file_path: path to the FASTA, optionally gzipped
+    :param Mapping expected: level-1 collection with names and lengths, and
+        sequences to check the sequence digests too
+    :param int threads: number of threads hashing an indexed FASTA
+    :param bool stop_early: whether to stop at the first difference, or find
+        them all
+    :param str fai_cache_dir: directory holding the .fai; see find_fai
+    :return dict: whether the FASTA matches, and the differences found: the
+        expected names missing from the FASTA, unexpected names, whether the
+        names are reordered, the names whose length or sequence digest
+        differs, and the number of sequences hashed. After stopping early,
+        records the check did not reach are not reported missing.
+    """
+    fai = find_fai(fa_file_path, fai_cache_dir)
+    if fai is None:
+        return _verify_fasta_single_pass(fa_file_path, expected, stop_early)
+    names, lengths = read_fai(fai)
+    report = _verify_names_lengths(names, lengths, expected)
+    if (stop_early and not report["match"]) or "sequences" not in expected:
+        return report
+    expected_digests = dict(zip(expected["names"], expected["sequences"]))
+    resized = set(report["length_mismatches"])
+    to_check = [n for n in names if n in expected_digests and n not in resized]
+    fa_object = parse_fasta(fa_file_path, fai_cache_dir=fai_cache_dir)
+    stop = threading.Event()
+
+    def check(name) -> bool:
+        """Hash one sequence, returning whether it was hashed"""
+        if stop.is_set():
+            return False
+        record = _digest_fasta_record(fa_object, name, {"sha512t24u"}, None, stop=stop)
+        if record is None:
+            return False
+        if record["sequence"] != expected_digests[name]:
+            report["sequence_mismatches"].append(name)
+            if stop_early:
+                stop.set()
+        return True
+
+    if threads <= 1:
+        checked = [check(name) for name in to_check]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            checked = list(executor.map(check, to_check))
+    order = {name: i for i, name in enumerate(names)}
+    report["sequence_mismatches"].sort(key=order.get)
+    report["sequences_checked"] = sum(checked)
+    report["match"] = report["match"] and not report["sequence_mismatches"]
+    return report
+
+
+def _verify_fasta_single_pass(fa_file_path: str, expected: Mapping, stop_early: bool) -> dict:
+    """verify_fasta for a FASTA without an index, checking each record as it is read"""
+    expected_names = list(expected["names"])
+    expected_lengths = dict(zip(expected_names, expected["lengths"]))
+    expected_digests = dict(zip(expected_names, expected.get("sequences", ())))
+    algorithms = {"sha512t24u"} if expected_digests else set()
+    names, lengths, sequence_mismatches = [], [], []
+    stopped = False
+    opener = gzip.open if fa_file_path.endswith(".gz") else open
+    with opener(fa_file_path, "rb") as f:
+        for record in _iter_fasta_records(f, algorithms, False):
+            names.append(record.name)
+            lengths.append(record.length)
+            hashed = record.length if algorithms else 0
+            METRICS.update(counters={"sequences_processed": 1, "bytes_hashed": hashed})
+            if record.name in expected_digests:
+                digest = _finalize_hashers(record.hashers, algorithms)["sha512t24u"]
+                if "SQ." + digest != expected_digests[record.name]:
+                    sequence_mismatches.append(record.name)
+            i = len(names) - 1
+            differs = (
+                sequence_mismatches
+                or i >= len(expected_names)
+                or expected_names[i] != record.name
+                or expected_lengths[record.name] != record.length
+            )
+            if stop_early and differs:
+                stopped = True
+                break
+    report = _verify_names_lengths(names, lengths, expected)
+    if stopped:
+        report["missing"] = []
+    report["sequence_mismatches"] = sequence_mismatches
+    report["sequences_checked"] = len(names) if algorithms else 0
+    report["match"] = report["match"] and not sequence_mismatches
+    return report
+
+
 def build_sorted_name_length_pairs(obj: dict, digest_function):
     """Builds the sorted_name_length_pairs attribute, which corresponds to the coordinate system"""
-    sorted_name_length_pairs = []
-    for i in range(len(obj["names"])):
-        sorted_name_length_pairs.append({"length": obj["lengths"][i], "name": obj["names"][i]})
     nl_digests = []  # name-length digests
-    for i in range(len(sorted_name_length_pairs)):
-        nl_digests.append(digest_function(canonical_str(sorted_name_length_pairs[i])))
+    for name, length in zip(obj["names"], obj["lengths"]):
+        if type(length) is int and type(name) is str:
+            nl_digests.append(digest_function(canonical_name_length_pair(name, length)))
+        else:
+            nl_digests.append(digest_function(canonical_str({"length": length, "name": name})))
 
     nl_digests.sort()
     return nl_digests
@@ -201,6 +1646,11 @@ def compare_seqcols(A: SeqCol, B: SeqCol):
     @param B Sequence collection B
     @return dict Following formal seqcol specification comparison function return value
     """
+    with METRICS.timer("compare"):
+        return _compare_seqcols(A, B)
+
+
+def _compare_seqcols(A: SeqCol, B: SeqCol):
     validate_seqcol(A)  # First ensure these are the right structure
     validate_seqcol(B)
 
@@ -216,7 +1666,6 @@ def compare_seqcols(A: SeqCol, B: SeqCol):
     }
 
     for k in all_keys:
-        _LOGGER.info(k)
         if k not in A:
             result[k] = {"flag": -1}
             return_obj["arrays"]["b_only"].append(k)
@@ -264,21 +1713,21 @@ def seqcol_digest(seqcol_obj: SeqCol, schema: dict = None) -> str:
     validate_seqcol(seqcol_obj)
     # Step 1a: Remove any non-inherent attributes,
     # so that only the inherent attributes contribute to the digest.
-    seqcol_obj2 = {}
     if schema:
-        for k in schema["inherent"]:
-            # Step 2: Apply RFC-8785 to canonicalize the value
-            # associated with each attribute individually.
-            seqcol_obj2[k] = canonical_str(seqcol_obj[k])
+        attributes = schema["inherent"]
     else:  # no schema provided, so assume all attributes are inherent
-        for k in seqcol_obj:
-            seqcol_obj2[k] = canonical_str(seqcol_obj[k])
+        attributes = list(seqcol_obj.keys())
+    # Step 2: Apply RFC-8785 to canonicalize the value
+    # associated with each attribute individually.
     # Step 3: Digest each canonicalized attribute value
     # using the GA4GH digest algorithm.
+    # canonical_digest does both at once, streaming the serialization
+    # into the hasher.
 
     seqcol_obj3 = {}
-    for attribute in seqcol_obj2:
-        seqcol_obj3[attribute] = sha512t24u_digest(seqcol_obj2[attribute])
+    with METRICS.timer("seqcol_digest"):
+        for attribute in attributes:
+            seqcol_obj3[attribute] = canonical_digest(seqcol_obj[attribute])
     # print(json.dumps(seqcol_obj3, indent=2))  # visualize the result
 
     # Step 4: Apply RFC-8785 again to canonicalize the JSON
@@ -292,7 +1741,7 @@ def seqcol_digest(seqcol_obj: SeqCol, schema: dict = None) -> str:
 
 
 def explain_flag(flag):
-    """Explains a compare flag"""
+    """Explains a compare flag, as computed by compare_flags or batch_compare_flags"""
     print(f"Flag: {flag}\nBinary: {bin(flag)}\n")
     for e in range(0, 13):
         if flag & 2**e:
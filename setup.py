@@ -18,6 +18,8 @@ with open("requirements/requirements-all.txt", "r") as reqs_file:
         DEPENDENCIES.append(line)
 
 extra["install_requires"] = DEPENDENCIES
+# vectorizes batch_compare_flags
+extra["extras_require"] = {"numpy": ["numpy"]}
 
 with open("{}/_version.py".format(PACKAGE), "r") as versionfile:
     version = versionfile.readline().split()[-1].strip("\"'\n")
@@ -45,7 +47,7 @@ setup(
     author="Nathan Sheffield, Michal Stolarczyk",
     author_email="nathan@code.databio.org",
     license="BSD2",
-    entry_points=None,
+    entry_points={"console_scripts": ["seqcol = seqcol.cli:main"]},
     include_package_data=True,
     test_suite="tests",
     tests_require=(["mock", "pytest"]),
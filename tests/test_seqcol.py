@@ -1,7 +1,13 @@
+import asyncio
+import henge
+import io
 import json
 import os
 import pytest
 import seqcol
+import shutil
+
+from hypothesis import given, strategies as st
 
 # from seqcol import SeqColHenge, validate_seqcol, compare
 # from seqcol.const import *
@@ -122,3 +128,949 @@ class TestValidate:
     def test_failure(self, seqcol_obj):
         with pytest.raises(Exception):
             seqcol.validate_seqcol(seqcol_obj)
+
+
+HEADER_FILES = [
+    ("demo0.sam", seqcol.sam_header_to_seqcol),
+    ("demo0.bam", seqcol.sam_header_to_seqcol),
+    ("demo0.cram", seqcol.sam_header_to_seqcol),
+    ("demo0.vcf.gz", seqcol.vcf_header_to_seqcol),
+]
+
+
+class TestHeaderIngestion:
+    """
+    Test building level-1 collections from SAM/BAM/CRAM and VCF headers
+    """
+
+    @pytest.mark.parametrize(["header_file", "loader"], HEADER_FILES)
+    def test_header_matches_fasta(self, header_file, loader, fa_root):
+        csc = loader(os.path.join(fa_root, header_file))
+        fasta_csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, DEMO_FILES[0]))
+        for k in ["names", "lengths", "sorted_name_length_pairs"]:
+            assert csc[k] == fasta_csc[k]
+        assert len(csc["md5_sequences"]) == 3
+        assert seqcol.validate_seqcol(csc)
+
+    @pytest.mark.parametrize("version", ["2.1", "3.0", "3.1"])
+    def test_htslib_cram_versions(self, fa_root, tmp_path, version):
+        pysam = pytest.importorskip("pysam")
+        cram = str(tmp_path / "demo0.cram")
+        sam = os.path.join(fa_root, "demo0.sam")
+        options = ["--output-fmt-option", f"version={version}", "--output-fmt-option", "no_ref=1"]
+        pysam.view("-C", *options, "-o", cram, sam, catch_stdout=False)
+        csc = seqcol.sam_header_to_seqcol(cram)
+        assert csc == seqcol.sam_header_to_seqcol(sam)
+
+    def test_bam_reference_list(self, fa_root, tmp_path):
+        import gzip
+        import struct
+
+        with gzip.open(os.path.join(fa_root, "demo0.bam"), "rb") as f:
+            data = f.read()
+        l_text = struct.unpack("<i", data[4:8])[0]
+        text = b"@HD\tVN:1.6\n"
+        bam = tmp_path / "no_sq.bam"
+        with gzip.open(bam, "wb") as f:
+            f.write(data[:4] + struct.pack("<i", len(text)) + text + data[8 + l_text :])
+        csc = seqcol.sam_header_to_seqcol(str(bam))
+        fasta_csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        assert csc["names"] == fasta_csc["names"]
+        assert csc["lengths"] == fasta_csc["lengths"]
+        assert "md5_sequences" not in csc
+
+    def test_no_contigs(self, tmp_path, capsys):
+        from seqcol.cli import main
+
+        vcf = tmp_path / "empty.vcf"
+        vcf.write_text("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n")
+        sam = tmp_path / "empty.sam"
+        sam.write_text("@HD\tVN:1.6\n")
+        bcf = tmp_path / "x.bcf"
+        bcf.write_bytes(b"BCF\2\2")
+        with pytest.raises(ValueError):
+            seqcol.vcf_header_to_seqcol(str(vcf))
+        with pytest.raises(ValueError):
+            seqcol.sam_header_to_seqcol(str(sam))
+        for path in [vcf, sam, bcf]:
+            assert main(["digest", str(path)]) == 2
+        assert capsys.readouterr().out == ""
+
+    def test_sq_missing_length(self, tmp_path):
+        sam = tmp_path / "bad.sam"
+        sam.write_text("@HD\tVN:1.6\n@SQ\tSN:chr1\tLN:4\n@SQ\tSN:chr2\n")
+        with pytest.raises(ValueError, match="line 3 has no LN tag"):
+            seqcol.sam_header_to_seqcol(str(sam))
+
+
+class TestMultiDigest:
+    """
+    Test computing several sequence digests in one pass
+    """
+
+    def test_multi_digest_matches_single_digests(self):
+        seq = "ACGTNACGT"
+        digests = seqcol.multi_digest(seq.encode(), ["sha512t24u", "md5", "trunc512"])
+        assert digests["sha512t24u"] == seqcol.sha512t24u_digest(seq)
+        assert digests["trunc512"] == seqcol.trunc512_digest(seq)
+
+    def test_sidecar_roundtrip(self, fa_root, tmp_path):
+        sidecar = str(tmp_path / "demo0.chrom.sizes")
+        csc = seqcol.fasta_file_to_seqcol(
+            os.path.join(fa_root, DEMO_FILES[0]),
+            extra_digests=["md5", "trunc512"],
+            sidecar_file=sidecar,
+        )
+        header_csc = seqcol.sam_header_to_seqcol(os.path.join(fa_root, "demo0.sam"))
+        assert csc["md5_sequences"] == header_csc["md5_sequences"]
+        assert len(csc["trunc512_sequences"]) == 3
+        sidecar_csc = seqcol.chrom_sizes_to_seqcol(sidecar, extra_digests=["md5"])
+        for k in ["names", "lengths", "sequences", "sorted_name_length_pairs", "md5_sequences"]:
+            assert sidecar_csc[k] == csc[k]
+
+
+class TestSelectiveAttributes:
+    """
+    Test computing only the attributes a schema or caller asks for
+    """
+
+    def test_schema_attributes(self, fa_root):
+        schema = seqcol.seqcol_schema()
+        assert seqcol.select_attributes(schema) == ["lengths", "names", "sequences"]
+        f = os.path.join(fa_root, DEMO_FILES[0])
+        full = seqcol.fasta_file_to_seqcol(f, verbose=False)
+        csc = seqcol.fasta_file_to_seqcol(f, verbose=False, schema=schema)
+        assert sorted(csc) == ["lengths", "names", "sequences"]
+        assert seqcol.seqcol_digest(csc, schema) == seqcol.seqcol_digest(full, schema)
+
+    @pytest.mark.parametrize("indexed", [True, False])
+    def test_coordinate_system_skips_hashing(self, fa_root, tmp_path, indexed):
+        f = os.path.join(fa_root, "demo0.fa")
+        full = seqcol.fasta_file_to_seqcol(f, verbose=False)
+        if not indexed:
+            f = str(tmp_path / "demo0.fa")
+            shutil.copyfile(os.path.join(fa_root, "demo0.fa"), f)
+        before = seqcol.METRICS.snapshot()["counters"].get("bytes_hashed", 0)
+        csc = seqcol.fasta_file_to_seqcol(
+            f, verbose=False, attributes=["sorted_name_length_pairs"]
+        )
+        assert csc == {"sorted_name_length_pairs": full["sorted_name_length_pairs"]}
+        assert seqcol.METRICS.snapshot()["counters"].get("bytes_hashed", 0) == before
+
+    def test_registered_attribute(self, fa_root, tmp_path):
+        seqcol.register_attribute(
+            "name_md5", lambda record, digest: f"{record['name']}:{record['md5']}", ["md5"]
+        )
+        try:
+            f = os.path.join(fa_root, DEMO_FILES[0])
+            csc = seqcol.fasta_file_to_seqcol(
+                f, verbose=False, attributes=["names", "name_md5"], extra_digests=["md5"]
+            )
+            assert csc["name_md5"] == [
+                f"{name}:{md5}" for name, md5 in zip(csc["names"], csc["md5_sequences"])
+            ]
+            sidecar = str(tmp_path / "demo.chrom.sizes")
+            seqcol.fasta_file_to_seqcol(f, verbose=False, sidecar_file=sidecar)
+            from_sidecar = seqcol.chrom_sizes_to_seqcol(
+                sidecar, attributes=["names", "name_md5"], extra_digests=["md5"]
+            )
+            assert from_sidecar == csc
+        finally:
+            del seqcol.ATTRIBUTE_FUNCTIONS["name_md5"]
+        with pytest.raises(ValueError):
+            seqcol.fasta_file_to_seqcol(f, verbose=False, attributes=["name_md5"])
+
+    def test_chrom_sizes_without_digests(self, fa_root, tmp_path):
+        full = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, DEMO_FILES[0]), verbose=False)
+        sizes = tmp_path / "demo0.chrom.sizes"
+        sizes.write_text("".join(f"{n}\t{l}\n" for n, l in zip(full["names"], full["lengths"])))
+        attributes = ["lengths", "names", "sorted_name_length_pairs"]
+        csc = seqcol.chrom_sizes_to_seqcol(str(sizes), attributes=attributes)
+        assert csc == {k: full[k] for k in attributes}
+        with pytest.raises(ValueError):
+            seqcol.chrom_sizes_to_seqcol(str(sizes))
+
+
+small_collections = st.lists(
+    st.fixed_dictionaries(
+        {
+            "sequences": st.lists(st.sampled_from(["SQ.a", "SQ.b", "SQ.c", "SQ.d"]), max_size=5),
+            "names": st.lists(st.sampled_from(["chr1", "chr2", "chr3"]), max_size=5),
+            "lengths": st.lists(st.integers(min_value=1, max_value=4), max_size=5),
+        },
+        optional={"topologies": st.lists(st.sampled_from(["linear", "circular"]), max_size=5)},
+    ),
+    min_size=1,
+    max_size=6,
+)
+
+
+class TestCompareFlags:
+    """
+    Test the bit-flag compare of single and many pairs of collections
+    """
+
+    def test_flags(self, fa_root):
+        from seqcol.const import CONTENT_A_ORDER, CONTENT_B_ORDER, NAMES_ALL_A_IN_B
+
+        a = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        reordered = {k: v[::-1] for k, v in a.items()}
+        flag = seqcol.compare_flags(a, a)
+        assert flag == 2**13 - 1 - seqcol.TOPO_ALL_A_IN_B - seqcol.TOPO_ALL_B_IN_A
+        assert not seqcol.compare_flags(a, reordered) & (CONTENT_A_ORDER | CONTENT_B_ORDER)
+        subset = {k: v[:1] for k, v in a.items()}
+        flag = seqcol.compare_flags(subset, a)
+        assert flag & NAMES_ALL_A_IN_B and not flag & seqcol.NAMES_ALL_B_IN_A
+        assert not flag & CONTENT_A_ORDER  # a single shared sequence has no order
+
+    def test_explain_flag(self, fa_root, capsys):
+        a = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        b = {k: v[:1] for k, v in a.items()}
+        seqcol.explain_flag(seqcol.compare_flags(a, b))
+        explained = capsys.readouterr().out.split()
+        assert "CONTENT_ALL_B_IN_A" in explained and "NAMES_ANY_SHARED" in explained
+        assert "CONTENT_ALL_A_IN_B" not in explained
+
+    @given(small_collections, small_collections)
+    def test_batch_matches_single(self, queries, references):
+        expected = [seqcol.compare_flags(q, r) for q in queries for r in references]
+        assert list(seqcol.batch_compare_flags(queries, references, batch_size=7)) == expected
+        pairs = [(q, r) for q in range(len(queries)) for r in range(len(references))][::-2]
+        flags = seqcol.batch_compare_flags(queries, references, pairs)
+        assert list(flags) == [expected[q * len(references) + r] for q, r in pairs]
+        assert len(seqcol.batch_compare_flags(queries, references, [])) == 0
+
+    def test_without_numpy(self, monkeypatch):
+        import seqcol.flags
+
+        collections = [seqcol.names_lengths_to_seqcol(["chr1", "chr2"], [n, 2]) for n in (1, 5)]
+        expected = list(seqcol.batch_compare_flags(collections, collections))
+        monkeypatch.setattr(seqcol.flags, "np", None)
+        assert list(seqcol.batch_compare_flags(collections, collections)) == expected
+        assert list(seqcol.batch_compare_flags(collections, collections, [(1, 0)])) == [
+            expected[2]
+        ]
+
+
+class TestThreadedDigest:
+    """
+    Test that thread-pool digesting matches serial digesting
+    """
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_threads_match_serial(self, fasta_name, fa_root):
+        f = os.path.join(fa_root, fasta_name)
+        serial = seqcol.fasta_file_to_seqcol(f, extra_digests=["md5"])
+        threaded = seqcol.fasta_file_to_seqcol(f, extra_digests=["md5"], threads=4)
+        assert threaded == serial
+
+
+name_length_pairs = st.lists(
+    st.fixed_dictionaries({"length": st.integers(min_value=0, max_value=2**63), "name": st.text()})
+)
+seqcol_arrays = st.one_of(
+    st.lists(st.integers(min_value=-(2**63), max_value=2**63)),
+    st.lists(st.text()),
+    name_length_pairs,
+    st.lists(st.one_of(st.integers(), st.text(), st.booleans(), st.none())),
+)
+
+
+class TestCanonicalSerializer:
+    """
+    Cross-check the fast canonical serializer against canonical_str
+    """
+
+    @given(seqcol_arrays)
+    def test_fast_canonical_str_matches(self, item):
+        assert seqcol.fast_canonical_str(item) == seqcol.canonical_str(item)
+        assert seqcol.canonical_digest(item) == seqcol.sha512t24u_digest(
+            seqcol.canonical_str(item)
+        )
+
+    @given(seqcol_arrays)
+    def test_chunking_is_invisible(self, item):
+        chunks = list(seqcol.iter_canonical_str(item, chunk_size=3))
+        assert "".join(chunks) == seqcol.canonical_str(item)
+
+    @given(name_length_pairs)
+    def test_name_length_pair(self, pairs):
+        for pair in pairs:
+            assert seqcol.canonical_name_length_pair(
+                pair["name"], pair["length"]
+            ) == seqcol.canonical_str(pair)
+
+
+seqcol_dicts = st.dictionaries(st.text(), seqcol_arrays, max_size=4)
+
+
+class TestStreamingJSON:
+    """
+    Test the streaming serializers and the streaming collection parser
+    """
+
+    @given(seqcol_dicts)
+    def test_streamed_objects_match(self, item):
+        chunks = list(seqcol.iter_canonical_str(item, chunk_size=3))
+        assert "".join(chunks) == seqcol.canonical_str(item)
+
+    @given(seqcol_dicts)
+    def test_parser_round_trip(self, item):
+        body = json.dumps(item, indent=1).encode()
+        for chunk_size in [1, 7, 65536]:
+            parsed = seqcol.load_seqcol_json(io.BytesIO(body), chunk_size=chunk_size)
+            assert parsed.to_dict() == item
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_collections_and_comparisons(self, fasta_name, fa_root):
+        csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, fasta_name))
+        parsed = seqcol.load_seqcol_json(io.BytesIO(json.dumps(csc).encode()))
+        assert "".join(seqcol.iter_canonical_str(parsed)) == seqcol.canonical_str(csc)
+        itemwise = "".join(seqcol.iter_itemwise_json(parsed, chunk_size=2))
+        assert itemwise == seqcol.canonical_str(seqcol.format_itemwise(csc))
+        comparison = seqcol.compare_seqcols(csc, parsed)
+        out = io.BytesIO()
+        seqcol.write_json_chunks(seqcol.iter_canonical_str(comparison), out)
+        assert out.getvalue().decode() == seqcol.canonical_str(comparison)
+
+    def test_print_seqcol(self, fa_root, capsys):
+        csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, DEMO_FILES[0]), verbose=False)
+        seqcol.print_csc(seqcol.load_seqcol_json(io.BytesIO(json.dumps(csc).encode())))
+        assert capsys.readouterr().out == json.dumps(csc, indent=2) + "\n"
+
+    def test_body_limit(self):
+        body = io.BytesIO(b'{"lengths":[12345678901234]}{"unread":1}')
+        parsed = seqcol.load_seqcol_json(body, chunk_size=2, limit=28)
+        assert parsed.to_dict() == {"lengths": [12345678901234]}
+        assert body.read() == b'{"unread":1}'
+
+    @pytest.mark.parametrize("body", [b"[1]", b'{"a":[1,}', b'{"a":1', b"{1:2}", b""])
+    def test_malformed(self, body):
+        with pytest.raises(ValueError):
+            seqcol.load_seqcol_json(io.BytesIO(body))
+
+
+class TestSeqColObject:
+    """
+    Test that array-backed SeqCol objects behave like level-1 dicts
+    """
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_seqcol_matches_dict(self, fasta_name, fa_root):
+        csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, fasta_name))
+        obj = seqcol.SeqCol.from_dict(csc)
+        assert seqcol.validate_seqcol(obj)
+        assert seqcol.seqcol_digest(obj) == seqcol.seqcol_digest(csc)
+        assert obj.to_dict() == csc
+        assert obj.to_json() == seqcol.canonical_str(csc)
+        assert seqcol.compare_seqcols(obj, obj) == seqcol.compare_seqcols(csc, csc)
+
+    def test_henge_insert(self, fa_root):
+        csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, DEMO_FILES[0]), verbose=False)
+        scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        digest = scc.insert(seqcol.SeqCol.from_dict(csc), seqcol.SCAS_NAME, reclimit=1)
+        assert digest == scc.insert(csc, seqcol.SCAS_NAME, reclimit=1)
+        assert scc.retrieve(digest, reclimit=1) == csc
+
+    def test_const_alias(self):
+        from seqcol.const import SeqCol
+
+        assert SeqCol is seqcol.SeqCol
+
+    def test_variable_width_strings(self):
+        obj = seqcol.SeqCol(names=["chr1", "chr10", "ü"], lengths=[1, 2, 3])
+        assert obj["names"][1] == "chr10"
+        assert obj["names"][-1] == "ü"
+        assert "chr10" in obj["names"] and "chr" not in obj["names"]
+        assert obj.to_json() == seqcol.canonical_str(obj.to_dict())
+
+
+class TestCatalog:
+    """
+    Test exporting collections to a columnar catalog and serving them from it
+    """
+
+    def test_catalog_roundtrip(self, fa_root, tmp_path):
+        scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        loaded = {}
+        for fasta_name in DEMO_FILES:
+            res = scc.load_fasta_from_filepath(os.path.join(fa_root, fasta_name))
+            loaded[res["digest"]] = res["SCAS"]
+        path = str(tmp_path / "collections.catalog")
+        assert scc.export_catalog(path) == len(loaded)
+
+        cold = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        catalog = cold.load_catalog(path)
+        for digest, csc in loaded.items():
+            assert cold.retrieve(digest, reclimit=1).to_dict() == csc
+            assert cold.compare_digests(digest, digest) == seqcol.compare_seqcols(csc, csc)
+        first_seq = loaded[sorted(loaded)[0]]["sequences"][0]
+        expected = sorted(d for d, csc in loaded.items() if first_seq in csc["sequences"])
+        assert catalog.find("sequences", first_seq) == expected
+        assert sorted(catalog.find("names", "chr1")) == sorted(
+            d for d, csc in loaded.items() if "chr1" in csc["names"]
+        )
+
+    def test_catalog_compare_processes(self, fa_root, tmp_path):
+        collections = {}
+        for fasta_name in DEMO_FILES:
+            csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, fasta_name))
+            collections[seqcol.seqcol_digest(csc)] = csc
+        path = str(tmp_path / "collections.catalog")
+        seqcol.write_catalog(collections, path)
+        with seqcol.SeqColCatalog(path) as catalog:
+            query = collections[sorted(collections)[0]]
+            serial = catalog.compare(query)
+            parallel = catalog.compare(query, processes=2)
+            assert serial == parallel
+            assert serial == {d: seqcol.compare_seqcols(query, c) for d, c in collections.items()}
+
+
+class CountingDict(dict):
+    """Database that records which keys were read"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return super().__getitem__(key)
+
+
+class TestLazyRetrieval:
+    """
+    Test lazy proxies returned by SeqColHenge.retrieve
+    """
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_lazy_matches_eager(self, fasta_name, fa_root):
+        scc = seqcol.SeqColHenge(database={})
+        d, _ = scc.load_fasta(os.path.join(fa_root, fasta_name))
+        lazy = scc.retrieve(d, lazy=True)
+        assert lazy == scc.retrieve(d)
+        assert lazy.tolist() == scc.retrieve(d)
+
+    def test_lazy_skips_unused_attributes(self, fa_root):
+        db = CountingDict()
+        scc = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        res = scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+        flat = scc.retrieve(res["digest"], reclimit=0)
+        db.reads.clear()
+        proxy = scc.retrieve(res["digest"], reclimit=1, lazy=True)
+        assert list(proxy["names"]) == res["SCAS"]["names"]
+        assert list(proxy["lengths"]) == res["SCAS"]["lengths"]
+        assert proxy["names"] is proxy["names"]  # memoized
+        assert flat["sequences"] not in db.reads
+        assert proxy.to_dict() == res["SCAS"]
+
+
+class TestAsyncHenge:
+    """
+    Test the awaitable SeqColHenge interface
+    """
+
+    def test_async_matches_sync(self, fa_root):
+        async def run():
+            async with seqcol.AsyncSeqColHenge(
+                seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+            ) as scc:
+                res = await scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+                d = res["digest"]
+                assert await scc.insert(res["SCAS"], seqcol.SCAS_NAME, reclimit=1) == d
+                assert await scc.retrieve(d, reclimit=1) == res["SCAS"]
+                assert await scc.compare_digests(d, d) == seqcol.compare_seqcols(
+                    res["SCAS"], res["SCAS"]
+                )
+
+        asyncio.run(run())
+
+    def test_requests_are_coalesced(self, fa_root):
+        db = CountingDict()
+        henge_obj = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        d = henge_obj.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))["digest"]
+        db.reads.clear()
+
+        async def run():
+            async with seqcol.AsyncSeqColHenge(henge_obj, max_concurrency=2) as scc:
+                return await asyncio.gather(*[scc.retrieve(d, reclimit=1) for _ in range(10)])
+
+        results = asyncio.run(run())
+        assert all(r == results[0] for r in results)
+        assert db.reads.count(d) == 1
+
+
+class TestMetrics:
+    """
+    Test the metrics registry and progress callbacks
+    """
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_fasta_counters(self, fasta_name, fa_root, capsys):
+        seqcol.METRICS.reset()
+        calls = []
+        csc = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, fasta_name))
+        capsys.readouterr()
+        fa = seqcol.parse_fasta(os.path.join(fa_root, fasta_name))
+        seqcol.fasta_obj_to_seqcol(fa, verbose=False, progress=lambda *a: calls.append(a))
+        assert capsys.readouterr().out == ""
+        n = len(csc["names"])
+        assert [c[:2] for c in calls] == [(i + 1, n) for i in range(n)]
+        snapshot = seqcol.METRICS.snapshot()
+        assert snapshot["counters"]["sequences_processed"] == 2 * n
+        assert snapshot["counters"]["bytes_hashed"] == 2 * sum(csc["lengths"])
+        assert snapshot["timers"]["hash"]["count"] == 2 * n
+        assert {"read", "canonicalize"} <= set(snapshot["timers"])
+
+    def test_hooks_and_prometheus(self, fa_root):
+        metrics = seqcol.Metrics()
+        events = []
+        metrics.add_hook(lambda *event: events.append(event))
+        metrics.increment("validator_calls")
+        with metrics.timer("insert"):
+            with metrics.timer("insert"):
+                pass
+        assert events[0] == ("counter", "validator_calls", 1)
+        assert [e[:2] for e in events[1:]] == [("timer", "insert")]
+        text = metrics.to_prometheus()
+        assert "seqcol_validator_calls_total 1\n" in text
+        assert 'seqcol_phase_seconds_count{phase="insert"} 1\n' in text
+        metrics.enabled = False
+        metrics.increment("validator_calls")
+        assert metrics.snapshot()["counters"]["validator_calls"] == 1
+
+    def test_henge_counters(self, fa_root):
+        seqcol.METRICS.reset()
+        scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        res = scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+        scc.compare_digests(res["digest"], res["digest"])
+        snapshot = seqcol.METRICS.snapshot()
+        assert snapshot["timers"]["insert"]["count"] == 1
+        assert snapshot["timers"]["compare"]["count"] == 1
+        assert snapshot["counters"]["validator_calls"] == 2
+        assert snapshot["counters"]["db_retrievals"] > 2
+
+    def test_rate_limited(self):
+        calls = []
+        progress = seqcol.rate_limited(lambda *a: calls.append(a), interval=3600)
+        for i in range(1, 101):
+            progress(i, 100, f"chr{i}")
+        assert calls == [(1, 100, "chr1"), (100, 100, "chr100")]
+
+
+class TestCLI:
+    """
+    Test the command line interface and lazy package imports
+    """
+
+    def test_import_is_light(self):
+        import subprocess
+        import sys
+
+        code = (
+            "import sys, seqcol; "
+            "print(sorted(m for m in ('henge', 'jsonschema', 'pyfaidx', 'asyncio', 'numpy') "
+            "if m in sys.modules))"
+        )
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        assert out.stdout.strip() == "[]"
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_digest(self, fasta_name, fa_root, capsys):
+        from seqcol.cli import main
+
+        path = os.path.join(fa_root, fasta_name)
+        assert main(["digest", path]) == 0
+        assert capsys.readouterr().out.strip() == seqcol.fasta_file_to_digest(path)
+
+    def test_compare_and_validate(self, fa_root, tmp_path, capsys):
+        from seqcol.cli import main
+
+        a, b = (os.path.join(fa_root, f) for f in DEMO_FILES[:2])
+        assert main(["compare", a, b]) == 0
+        expected = seqcol.compare_seqcols(
+            seqcol.fasta_file_to_seqcol(a, verbose=False),
+            seqcol.fasta_file_to_seqcol(b, verbose=False),
+        )
+        assert json.loads(capsys.readouterr().out) == expected
+        good, bad = tmp_path / "good.json", tmp_path / "bad.json"
+        assert main(["digest", "--collection", a]) == 0
+        good.write_text(capsys.readouterr().out)
+        bad.write_text(json.dumps(bad_seqcol))
+        assert main(["validate", str(good)]) == 0
+        assert main(["validate", str(good), str(bad)]) == 1
+        assert main(["digest", str(tmp_path / "unknown.txt")]) == 2
+
+
+class TestSharding:
+    """
+    Test a SeqColHenge over a ShardedDatabase of SQLite files
+    """
+
+    def sharded_henge(self, tmp_path, n):
+        stores = {f"shard{i}": seqcol.SQLiteStore(str(tmp_path / f"{i}.db")) for i in range(n)}
+        db = seqcol.ShardedDatabase(stores)
+        return seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS), db
+
+    def test_insert_retrieve_rebalance(self, fa_root, tmp_path):
+        cscs = [
+            seqcol.fasta_file_to_seqcol(os.path.join(fa_root, f), verbose=False)
+            for f in DEMO_FILES
+        ]
+        reference = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        expected = [reference.insert(c, seqcol.SCAS_NAME, reclimit=1) for c in cscs]
+        scc, db = self.sharded_henge(tmp_path, 4)
+        digests = scc.insert_many(cscs, seqcol.SCAS_NAME, reclimit=1)
+        assert digests == expected
+        assert dict(db) == reference.database
+        assert sum(1 for store in db.shards.values() if len(store)) > 1
+        assert scc.retrieve_many(digests + ["missing"], reclimit=1) == dict(zip(digests, cscs))
+        assert scc.retrieve_many(digests, reclimit=0) == {
+            d: reference.retrieve(d, reclimit=0) for d in digests
+        }
+
+        moved = db.add_shard("shard4", seqcol.SQLiteStore(str(tmp_path / "4.db")))
+        assert 0 < moved < len(db)
+        assert db.rebalance() == 0
+        for d, csc in zip(digests, cscs):
+            assert scc.retrieve(d, reclimit=1) == csc
+        db.close()
+
+    def test_failed_batch_writes_nothing(self, tmp_path):
+        scc, db = self.sharded_henge(tmp_path, 2)
+        with pytest.raises(RuntimeError):
+            with db.batch():
+                db["a"] = "1"
+                assert db["a"] == "1"
+                raise RuntimeError()
+        assert "a" not in db
+        db.close()
+
+
+class TestBloomFilter:
+    """
+    Test the Bloom filter of stored digests checked before retrieve
+    """
+
+    def test_filter_grows_without_false_negatives(self, tmp_path):
+        bloom = seqcol.BloomFilter(capacity=100, error_rate=0.01)
+        bloom.update(f"digest{i}" for i in range(2000))
+        assert len(bloom.stages) > 1
+        assert all(f"digest{i}" in bloom for i in range(2000))
+        assert sum(f"other{i}" in bloom for i in range(10000)) < 200
+        bloom.save(str(tmp_path / "filter"), note="test")
+        loaded, metadata = seqcol.BloomFilter.load(str(tmp_path / "filter"))
+        assert metadata == {"note": "test"}
+        assert all(f"digest{i}" in loaded for i in range(2000))
+
+    def test_henge_lookups(self, fa_root, tmp_path):
+        path = str(tmp_path / "digests.bloom")
+        db = CountingDict()
+        scc = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        first = scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+        scc.enable_bloom_filter(path)
+        second = scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[1]))
+        for res in [first, second]:
+            assert scc.retrieve(res["digest"], reclimit=1) == res["SCAS"]
+        seqcol.METRICS.reset()
+        db.reads.clear()
+        with pytest.raises(henge.NotFoundException):
+            scc.retrieve("missing")
+        assert scc.retrieve_many(["missing"]) == {}
+        assert db.reads == []
+        assert seqcol.METRICS.snapshot()["counters"]["bloom_avoided_lookups"] == 2
+
+        scc.save_bloom_filter()
+        reopened = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        assert len(reopened.enable_bloom_filter(path)) == len(scc.bloom)
+        db["stale_item_type"] = seqcol.SCAS_NAME
+        rebuilt = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        assert "stale" in rebuilt.enable_bloom_filter(path)
+
+    def test_shared_database(self, fa_root):
+        db = {}
+        reader = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        reader.enable_bloom_filter()
+        writer = seqcol.SeqColHenge(database=db, schemas=seqcol.SCAS_SCHEMAS)
+        res = writer.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+        assert reader.retrieve(res["digest"], reclimit=1) == res["SCAS"]
+        assert reader.retrieve_many([res["digest"]], reclimit=1) == {res["digest"]: res["SCAS"]}
+        other = writer.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[1]))
+        mine = reader.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[2]))
+        assert reader.retrieve(other["digest"], reclimit=1) == other["SCAS"]
+        assert reader.retrieve(mine["digest"], reclimit=1) == mine["SCAS"]
+        with pytest.raises(henge.NotFoundException):
+            reader.retrieve("missing")
+
+    def test_miss_skips_sqlite(self, fa_root, tmp_path):
+        store = seqcol.SQLiteStore(str(tmp_path / "henge.db"))
+        scc = seqcol.SeqColHenge(database=store, schemas=seqcol.SCAS_SCHEMAS)
+        res = scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[0]))
+        scc.enable_bloom_filter()
+        scc.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[1]))
+        queries = []
+        store._conn.set_trace_callback(queries.append)
+        with pytest.raises(henge.NotFoundException):
+            scc.retrieve("missing")
+        assert scc.retrieve_many(["missing", "other"]) == {}
+        assert queries == []
+        assert scc.retrieve(res["digest"], reclimit=1) == res["SCAS"]
+        # another connection is invisible to the filter until it is refreshed
+        other_store = seqcol.SQLiteStore(str(tmp_path / "henge.db"))
+        writer = seqcol.SeqColHenge(database=other_store, schemas=seqcol.SCAS_SCHEMAS)
+        other = writer.load_fasta_from_filepath(os.path.join(fa_root, DEMO_FILES[2]))
+        scc.refresh_bloom_filter()
+        assert scc.retrieve(other["digest"], reclimit=1) == other["SCAS"]
+        other_store.close()
+        store.close()
+
+
+class TestSinglePassIndexing:
+    """
+    Test that unindexed FASTA files are indexed and digested in one pass
+    """
+
+    @pytest.mark.parametrize("fasta_name", DEMO_FILES)
+    def test_matches_pyfaidx(self, fasta_name, fa_root, tmp_path):
+        f = str(tmp_path / fasta_name)
+        original = os.path.join(fa_root, fasta_name)
+        shutil.copyfile(original, f)
+        expected = seqcol.fasta_file_to_seqcol(original, extra_digests=["md5"])
+        assert seqcol.find_fai(f) is None
+        assert seqcol.fasta_file_to_seqcol(f, extra_digests=["md5"], verbose=False) == expected
+        if fasta_name.endswith(".gz"):
+            assert not os.path.exists(f + ".fai")
+        else:
+            with open(original + ".fai") as fai:
+                assert open(f + ".fai").read() == fai.read()
+            assert seqcol.find_fai(f) == f + ".fai"
+
+    def test_cache_dir(self, fa_root, tmp_path):
+        f = str(tmp_path / "demo0.fa")
+        shutil.copyfile(os.path.join(fa_root, "demo0.fa"), f)
+        cache_dir = str(tmp_path / "cache")
+        first = seqcol.fasta_file_to_seqcol(f, fai_cache_dir=cache_dir, verbose=False)
+        assert not os.path.exists(f + ".fai")
+        fai = seqcol.find_fai(f, cache_dir)
+        assert fai == seqcol.fai_cache_path(f, cache_dir)
+        with open(os.path.join(fa_root, "demo0.fa.fai")) as expected:
+            assert open(fai).read() == expected.read()
+        assert seqcol.fasta_file_to_seqcol(f, fai_cache_dir=cache_dir, threads=2) == first
+
+    def test_henge_single_pass(self, fa_root, tmp_path):
+        f = str(tmp_path / "demo0.fa")
+        shutil.copyfile(os.path.join(fa_root, "demo0.fa"), f)
+        cache_dir = str(tmp_path / "cache")
+        scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        expected = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        before = seqcol.METRICS.snapshot()["counters"].get("bytes_hashed", 0)
+        res = scc.load_fasta_from_filepath(f, fai_cache_dir=cache_dir)
+        assert res["digest"] == seqcol.seqcol_digest(expected)
+        assert not os.path.exists(f + ".fai")
+        assert seqcol.find_fai(f, cache_dir) == seqcol.fai_cache_path(f, cache_dir)
+        hashed = seqcol.METRICS.snapshot()["counters"]["bytes_hashed"] - before
+        assert hashed == sum(expected["lengths"])
+        assert list(res["fa_object"].keys()) == expected["names"]
+        assert not os.path.exists(f + ".fai")
+
+    def test_stale_fai_next_to_fasta(self, fa_root, tmp_path):
+        f = str(tmp_path / "demo0.fa")
+        shutil.copyfile(os.path.join(fa_root, "demo0.fa"), f)
+        with open(f + ".fai", "w") as stale:
+            stale.write("old\t1\t5\t1\t2\n")
+        os.utime(f + ".fai", (0, 0))
+        cache_dir = str(tmp_path / "cache")
+        expected = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        assert seqcol.fasta_file_to_seqcol(f, fai_cache_dir=cache_dir, verbose=False) == expected
+        assert seqcol.find_fai(f, cache_dir) == seqcol.fai_cache_path(f, cache_dir)
+        assert list(seqcol.parse_fasta(f, cache_dir).keys()) == expected["names"]
+        assert os.path.getmtime(f + ".fai") == 0
+
+    def test_cli_cache_dir(self, fa_root, tmp_path, capsys):
+        from seqcol.cli import main
+
+        f = str(tmp_path / "demo2.fa")
+        shutil.copyfile(os.path.join(fa_root, "demo2.fa"), f)
+        cache_dir = str(tmp_path / "cache")
+        expected = seqcol.fasta_file_to_digest(os.path.join(fa_root, "demo2.fa"))
+        capsys.readouterr()
+        assert main(["digest", "--fai-cache-dir", cache_dir, f]) == 0
+        assert capsys.readouterr().out.strip() == expected
+        assert os.listdir(cache_dir) == [os.path.basename(seqcol.fai_cache_path(f, cache_dir))]
+
+    def test_irregular_lines(self, tmp_path):
+        f = tmp_path / "ragged.fa"
+        f.write_text(">a desc\nACG\nTTTT\nc\n>b\r\nGG\r\nA\r\n\n>c\n")
+        csc = seqcol.fasta_file_to_seqcol(str(f), verbose=False)
+        assert not os.path.exists(f"{f}.fai")
+        assert csc["names"] == ["a", "b", "c"]
+        assert csc["lengths"] == [8, 3, 0]
+        assert csc["sequences"] == [
+            "SQ." + seqcol.sha512t24u_digest(s) for s in ["ACGTTTTC", "GGA", ""]
+        ]
+
+
+class TestVerify:
+    @pytest.fixture
+    def copy(self, fa_root, tmp_path):
+        """Write a copy of demo0.fa, edited by replace, indexed if asked"""
+
+        def copy(indexed=True, replace=("", "")):
+            f = str(tmp_path / "demo0.fa")
+            with open(os.path.join(fa_root, "demo0.fa")) as src, open(f, "w") as dst:
+                dst.write(src.read().replace(*replace))
+            if indexed:
+                seqcol.parse_fasta(f)
+            return f
+
+        return copy
+
+    @pytest.mark.parametrize("indexed", [True, False])
+    @pytest.mark.parametrize("threads", [1, 2])
+    def test_match(self, fa_root, copy, indexed, threads):
+        expected = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        report = seqcol.verify_fasta(copy(indexed), expected, threads=threads)
+        assert report["match"]
+        assert report["sequences_checked"] == len(expected["names"])
+
+    @pytest.mark.parametrize("indexed", [True, False])
+    def test_sequence_mismatch_stops_early(self, fa_root, copy, indexed):
+        expected = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        f = copy(indexed, ("TTGGGGAA", "TTGGGGAC"))
+        report = seqcol.verify_fasta(f, expected)
+        assert not report["match"]
+        assert report["sequence_mismatches"] == ["chrX"]
+        assert report["sequences_checked"] == 1
+        report = seqcol.verify_fasta(f, expected, stop_early=False)
+        assert report["sequence_mismatches"] == ["chrX"]
+        assert report["sequences_checked"] == len(expected["names"])
+
+    @pytest.mark.parametrize(
+        "replace,key,value",
+        [
+            ((">chr1", ">chr9"), "unexpected", ["chr9"]),
+            ((">chr1\nGGAA", ">chr1\nGGAAT"), "length_mismatches", ["chr1"]),
+        ],
+    )
+    def test_index_mismatch_skips_hashing(self, fa_root, copy, replace, key, value):
+        expected = seqcol.fasta_file_to_seqcol(os.path.join(fa_root, "demo0.fa"), verbose=False)
+        f = copy(True, replace)
+        before = seqcol.METRICS.snapshot()["counters"].get("bytes_hashed", 0)
+        report = seqcol.verify_fasta(f, expected)
+        assert seqcol.METRICS.snapshot()["counters"].get("bytes_hashed", 0) == before
+        assert not report["match"]
+        assert report[key] == value
+        assert report["sequences_checked"] == 0
+
+    def test_henge(self, fa_root, copy):
+        scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+        digest = scc.load_fasta_from_filepath(os.path.join(fa_root, "demo0.fa"))["digest"]
+        assert scc.verify_fasta(copy(), digest)["match"]
+        report = scc.verify_fasta(copy(True, (">chr1\nGGAA", ">chr1\nGGAT")), digest, threads=2)
+        assert report["sequence_mismatches"] == ["chr1"]
+
+    def test_cli(self, fa_root, copy, tmp_path, capsys):
+        from seqcol.cli import main
+
+        original = os.path.join(fa_root, "demo0.fa")
+        digest = seqcol.fasta_file_to_digest(original)
+        capsys.readouterr()
+        assert main(["verify", copy(False), original, "--digest", digest]) == 0
+        assert json.loads(capsys.readouterr().out)["match"]
+        f = copy(False, (">chr1\nGGAA", ">chr1\nGGAT"))
+        assert main(["verify", f, original]) == 1
+        assert json.loads(capsys.readouterr().out)["sequence_mismatches"] == ["chr1"]
+        assert main(["verify", f, original, "--digest", "wrong"]) == 2
+
+
+@pytest.fixture
+def local_service(fa_root):
+    """A SeqColService holding the demo collections, served on a local port"""
+    import threading
+
+    scc = seqcol.SeqColHenge(database={}, schemas=seqcol.SCAS_SCHEMAS)
+    loaded = {}
+    for fasta_name in DEMO_FILES:
+        res = scc.load_fasta_from_filepath(os.path.join(fa_root, fasta_name))
+        loaded[res["digest"]] = res["SCAS"]
+    server = seqcol.SeqColService(scc).make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_port, loaded
+    server.shutdown()
+    server.server_close()
+
+
+class TestService:
+    """
+    Test the reference HTTP service against a local server
+    """
+
+    def test_endpoints(self, local_service):
+        import http.client
+
+        port, loaded = local_service
+        a, b = sorted(loaded)[:2]
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+
+        conn.request("GET", f"/collection/{a}")
+        res = conn.getresponse()
+        assert res.status == 200
+        assert json.loads(res.read()) == loaded[a]
+        etag = res.getheader("ETag")
+
+        conn.request("GET", f"/collection/{a}?level=2", headers={"If-None-Match": etag})
+        res = conn.getresponse()
+        res.read()
+        assert res.status == 304
+
+        conn.request("GET", f"/collection/{a}?level=1")
+        res = conn.getresponse()
+        assert set(json.loads(res.read())) == set(loaded[a])
+
+        conn.request("GET", f"/comparison/{a}/{b}")
+        res = conn.getresponse()
+        assert json.loads(res.read()) == seqcol.compare_seqcols(loaded[a], loaded[b])
+
+        conn.request("POST", f"/comparison/{a}", body=json.dumps(loaded[b]))
+        res = conn.getresponse()
+        assert json.loads(res.read()) == seqcol.compare_seqcols(loaded[a], loaded[b])
+
+        conn.request("GET", "/collection/nonexistent")
+        res = conn.getresponse()
+        res.read()
+        assert res.status == 404
+
+        for path in ["/collection/nope", f"/comparison/{a}/nope"]:
+            etag = '"nope-2"' if path.startswith("/collection") else f'"{a}-nope"'
+            conn.request("GET", path, headers={"If-None-Match": etag})
+            res = conn.getresponse()
+            res.read()
+            assert res.status == 404
+
+        body = json.dumps(loaded[b]).encode()
+        chunks = iter([body[:10], body[10:]])
+        conn.request("POST", f"/comparison/{a}", body=chunks, encode_chunked=True)
+        res = conn.getresponse()
+        assert json.loads(res.read()) == seqcol.compare_seqcols(loaded[a], loaded[b])
+        conn.request("GET", f"/collection/{a}")
+        res = conn.getresponse()
+        assert json.loads(res.read()) == loaded[a]
+
+        # bytes after the closing brace are drained, not read as a request
+        conn.request("POST", f"/comparison/{a}", body=body + b"\n" * 100000)
+        res = conn.getresponse()
+        assert json.loads(res.read()) == seqcol.compare_seqcols(loaded[a], loaded[b])
+        conn.request("GET", f"/collection/{a}")
+        res = conn.getresponse()
+        assert res.status == 200
+        assert json.loads(res.read()) == loaded[a]
+        conn.close()
+
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.putrequest("POST", f"/comparison/{a}")
+        conn.endheaders()
+        res = conn.getresponse()
+        res.read()
+        assert res.status == 411
+        conn.close()